@@ -0,0 +1,172 @@
+import asyncio
+import fcntl
+import heapq
+import hmac
+import itertools
+import os
+import tempfile
+import time
+
+from fastapi import HTTPException, Request
+
+from .metrics import ADMISSION_ACTIVE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTED_TOTAL
+
+# Admission control. Each endpoint gets a concurrency limit and a bounded wait queue.
+# When the queue is full (or a request waits too long) we fail fast with 503 and
+# Retry-After instead of piling up Chrome processes until the instance runs out of memory.
+
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", 5))
+# Seconds a queued request may wait for a slot, 0 waits forever
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+
+# X-Priority header -> queue priority (lower is served first)
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+# Anyone may lower their own priority, but "high" is only honoured with this key in X-Priority-Key
+ADMISSION_PRIORITY_KEY = os.getenv("ADMISSION_PRIORITY_KEY")
+
+# With several uvicorn workers the limits still hold for the whole instance: a request
+# holding a worker's slot also takes one of the instance's shared slots (see SharedSlots).
+# Queues, priorities and the gauges stay per worker.
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", 1)))
+ADMISSION_LOCK_DIR = os.getenv("ADMISSION_LOCK_DIR", os.path.join(tempfile.gettempdir(), "multiscrapper-admission"))
+# Seconds between attempts to take a shared slot
+ADMISSION_POLL_INTERVAL = float(os.getenv("ADMISSION_POLL_INTERVAL", 0.05))
+
+
+def request_priority(request):
+    """Queue priority for a request; "high" without the right X-Priority-Key counts as normal."""
+    priority = PRIORITIES.get(request.headers.get("x-priority", "normal").lower(), PRIORITIES["normal"])
+    if priority < PRIORITIES["normal"]:
+        key = request.headers.get("x-priority-key", "")
+        if not ADMISSION_PRIORITY_KEY or not hmac.compare_digest(key.encode(), ADMISSION_PRIORITY_KEY.encode()):
+            return PRIORITIES["normal"]
+    return priority
+
+
+class SharedSlots:
+    """
+    Slots shared by every worker process: one lock file per slot, held with flock.
+    The kernel drops the lock when a worker exits, so a crashed worker can't leak a slot.
+    """
+
+    def __init__(self, name, size, directory):
+        self.directory = directory
+        self.paths = [os.path.join(directory, f"{name}.{i}.lock") for i in range(size)]
+
+    def try_acquire(self):
+        """Returns an open handle holding a free slot, or None if all are taken."""
+        os.makedirs(self.directory, exist_ok=True)
+        for path in self.paths:
+            handle = open(path, "a")
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                continue
+            return handle
+        return None
+
+    @staticmethod
+    def release(handle):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+
+class AdmissionLimiter:
+    def __init__(self, name, limit, queue_size, shared=None):
+        self.name = name
+        # Limits are configurable per endpoint, e.g. ADMISSION_SCRAPE_LIMIT / ADMISSION_SCRAPE_QUEUE
+        self.limit = int(os.getenv(f"ADMISSION_{name.upper()}_LIMIT", limit))
+        self.queue_size = int(os.getenv(f"ADMISSION_{name.upper()}_QUEUE", queue_size))
+        self.active = 0
+        self.waiters = []  # heap of (priority, order, future)
+        self.order = itertools.count()
+        if shared is None:
+            shared = WORKERS > 1
+        self.shared = SharedSlots(name, self.limit, ADMISSION_LOCK_DIR) if shared else None
+        self.shared_handles = []
+
+    def _reject(self, reason, detail):
+        ADMISSION_REJECTED_TOTAL.labels(self.name, reason).inc()
+        raise HTTPException(
+            status_code=503,
+            detail=detail,
+            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)},
+        )
+
+    def _update_gauges(self):
+        ADMISSION_ACTIVE.labels(self.name).set(self.active)
+        ADMISSION_QUEUE_DEPTH.labels(self.name).set(len(self.waiters))
+
+    async def acquire(self, priority=PRIORITIES["normal"]):
+        deadline = time.monotonic() + ADMISSION_QUEUE_TIMEOUT if ADMISSION_QUEUE_TIMEOUT else None
+        await self._acquire_local(priority)
+        if self.shared is None:
+            return
+        try:
+            await self._acquire_shared(deadline)
+        except BaseException:
+            self._release_local()
+            raise
+
+    async def _acquire_shared(self, deadline):
+        # Other workers hold slots too; wait until one of the instance's slots is free
+        while True:
+            handle = self.shared.try_acquire()
+            if handle is not None:
+                self.shared_handles.append(handle)
+                return
+            if deadline is not None and time.monotonic() >= deadline:
+                self._reject("timeout", f"Server busy ({self.name} queue wait timed out). Please retry shortly.")
+            await asyncio.sleep(ADMISSION_POLL_INTERVAL)
+
+    async def _acquire_local(self, priority):
+        if self.active < self.limit and not self.waiters:
+            self.active += 1
+            self._update_gauges()
+            return
+
+        if len(self.waiters) >= self.queue_size:
+            self._reject("queue_full", f"Server busy ({self.name} queue is full). Please retry shortly.")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self.order), future)
+        heapq.heappush(self.waiters, entry)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(future, ADMISSION_QUEUE_TIMEOUT or None)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self._release_local()
+            elif entry in self.waiters:
+                self.waiters.remove(entry)
+                heapq.heapify(self.waiters)
+                self._update_gauges()
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout", f"Server busy ({self.name} queue wait timed out). Please retry shortly.")
+            raise
+
+    def release(self):
+        if self.shared_handles:
+            self.shared.release(self.shared_handles.pop())
+        self._release_local()
+
+    def _release_local(self):
+        # Hand the slot straight to the highest-priority waiter, if any
+        while self.waiters:
+            _, _, future = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+    async def slot(self, request: Request):
+        """FastAPI dependency that holds a slot for the duration of the request."""
+        await self.acquire(request_priority(request))
+        try:
+            yield
+        finally:
+            self.release()
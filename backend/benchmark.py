@@ -0,0 +1,393 @@
+"""
+Offline benchmark for every backend endpoint.
+
+Runs the FastAPI app in-process against local stand-ins: fake LLM providers with
+configurable latency and token rate, a local HTTP server serving fixture HTML pages
+(instead of Chrome), generated fixture PDFs, stubbed transcripts and a fake vision
+model. Reports throughput and p50/p95/p99 latency per endpoint and per stage
+(from Server-Timing) at several concurrency levels, and saves the results as JSON.
+
+    python -m backend.benchmark --concurrency 1,4,16 --requests 40
+    python -m backend.benchmark --compare bench_results/<previous>.json
+"""
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import httpx
+
+# --- Fake providers ---
+
+class FakeLLM:
+    """Stands in for a chat model. Latency = base latency + output tokens / token rate."""
+
+    def __init__(self, latency, tokens_per_sec, output_tokens, model="gemini-2.0-flash"):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.output_tokens = output_tokens
+        self.model = model
+
+    def _delay(self):
+        return self.latency + self.output_tokens / self.tokens_per_sec
+
+    def _reply(self, prompt):
+        if "JSON array" in prompt:
+            # Extraction prompt: return rows so merging is exercised
+            rows = [
+                {"name": f"Product {random.randint(1, 40)}", "price": "$19.99", "features": "fixture"}
+                for _ in range(5)
+            ]
+            return json.dumps(rows)
+        return " ".join(["token"] * self.output_tokens)
+
+    def invoke(self, prompt):
+        time.sleep(self._delay())
+        return SimpleNamespace(content=self._reply(str(prompt)))
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self._delay())
+        return SimpleNamespace(content=self._reply(str(prompt)))
+
+
+class FakeVisionModel:
+    latency = 0.5
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    def generate_content(self, parts):
+        time.sleep(self.latency)
+        return SimpleNamespace(text="A fixture page with a header, a product grid and a footer.")
+
+
+class FakeTranscriptApi:
+    latency = 0.2
+    words = 6000
+
+    def fetch(self, video_id, languages=None):
+        time.sleep(self.latency)
+        return [SimpleNamespace(text=f"word{i % 500}") for i in range(self.words)]
+
+    def list(self, video_id):
+        raise RuntimeError("not used by the stand-in")
+
+
+# --- Fixtures ---
+
+def make_catalog_html(products):
+    cards = "\n".join(
+        f"<div class='card'><h2>Product {i}</h2><p>Price: ${i % 90 + 9}.99</p>"
+        f"<p>Features: fast, light, model {i}</p></div>"
+        for i in range(products)
+    )
+    boilerplate = "<nav>Home | Shop | About | Contact</nav><div>We use cookies. Accept?</div>"
+    return f"<html><body>{boilerplate}{cards}{boilerplate}<footer>Footer</footer></body></html>"
+
+
+def make_pdf(pages, lines_per_page=40):
+    """Writes a minimal text-only PDF with the given number of pages."""
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in below
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for p in range(pages):
+        lines = [f"Page {p + 1} line {i}: benchmark fixture text about products and prices." for i in range(lines_per_page)]
+        stream = "BT /F1 10 Tf 40 800 Td 12 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_id = len(objects)
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>"
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{o:010d} 00000 n \n" for o in offsets).encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return out
+
+
+def make_screenshot(path):
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (1920, 4000), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(0, 4000, 200):
+        draw.rectangle((100, y + 20, 1820, y + 180), outline="black", fill=(200, (y // 10) % 255, 220))
+    img.save(path)
+
+
+def serve_fixtures(directory):
+    handler = functools.partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# --- Wiring ---
+
+def load_app(args, fixture_dir):
+    """Imports backend.main with the heavy/online pieces replaced by local stand-ins."""
+    if not args.real_embeddings:
+        import langchain_huggingface
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        langchain_huggingface.HuggingFaceEmbeddings = lambda model_name: DeterministicFakeEmbedding(size=384)
+
+    from backend import main, metrics, scraper
+
+    fake_llm = FakeLLM(args.llm_latency, args.llm_tokens_per_sec, args.llm_output_tokens)
+    main.get_llm = lambda provider, google_api_key=None, groq_api_key=None: fake_llm
+
+    FakeTranscriptApi.latency = args.transcript_latency
+    main.YouTubeTranscriptApi = FakeTranscriptApi
+
+    import google.generativeai as genai
+    FakeVisionModel.latency = args.vision_latency
+    genai.configure = lambda **kwargs: None
+    genai.GenerativeModel = FakeVisionModel
+
+    scraper.SCREENSHOT_DIR = os.path.join(fixture_dir, "screenshots")
+    with open(os.path.join(fixture_dir, "screenshot.png"), "rb") as f:
+        screenshot_png = f.read()
+
+    def fetch_page(url):
+        # Local stand-in for the Chrome scrape: plain HTTP fetch from the fixture server,
+        # storing the fixture screenshot the way Chrome's would be
+        with metrics.span("page_load"):
+            with urllib.request.urlopen(url) as response:
+                html = response.read().decode()
+        key, path = scraper.save_screenshot(url, screenshot_png)
+        return html, key, path
+
+    main.scrape_website = fetch_page
+    return main
+
+
+def build_cases(fixture_dir, base_url, page_text):
+    from backend import scraper
+    pdfs = {
+        size: open(os.path.join(fixture_dir, f"{size}.pdf"), "rb").read()
+        for size in ("small", "medium", "large")
+    }
+    screenshot = os.path.join(fixture_dir, "screenshot.png")
+    with open(screenshot, "rb") as f:
+        screenshot_key, _ = scraper.save_screenshot(f"{base_url}/catalog.html", f.read())
+    headers = {"x-google-api-key": "bench"}
+    # "ask" reuses one text, so after the first request it measures the cached index;
+    # "ask_cold" makes every text unique so each request splits, embeds and builds
+    cold_texts = (f"{page_text}\n\nBenchmark run {n}" for n in itertools.count())
+    # Likewise "vision" is answered from the analysis cache after the first request,
+    # while "vision_cold" varies the prompt so every request decodes, tiles and encodes
+    cold_prompts = (f"Describe the layout. (run {n})" for n in itertools.count())
+    cases = {
+        "youtube": lambda: ("POST", "/api/youtube", {"json": {"url": "https://youtube.com/watch?v=dQw4w9WgXcQ"}}),
+        "web_scrape": lambda: ("POST", "/api/web/scrape", {"json": {"url": f"{base_url}/catalog.html"}}),
+        "ask": lambda: ("POST", "/api/ask", {"data": {"text": page_text, "question": "Which product is cheapest?"}}),
+        "ask_cold": lambda: ("POST", "/api/ask", {"data": {"text": next(cold_texts), "question": "Which product is cheapest?"}}),
+        "extract": lambda: ("POST", "/api/web/extract", {"data": {"text": page_text}}),
+        "extract_full_page": lambda: ("POST", "/api/web/extract", {"data": {"text": page_text, "full_page": "true"}}),
+        "vision": lambda: ("POST", "/api/web/vision", {"data": {"image_path": screenshot, "prompt": "Describe the layout."}}),
+        "vision_cold": lambda: ("POST", "/api/web/vision", {"data": {"image_path": screenshot, "prompt": next(cold_prompts)}}),
+        "screenshot": lambda: ("GET", "/api/web/screenshot", {"params": {"key": screenshot_key}}),
+        "metrics": lambda: ("GET", "/metrics", {}),
+    }
+    for size, payload in pdfs.items():
+        cases[f"pdf_{size}"] = functools.partial(
+            lambda data: ("POST", "/api/pdf/vectorize", {"files": {"file": ("doc.pdf", data, "application/pdf")}}),
+            payload,
+        )
+    return cases, headers
+
+
+# --- Measurement ---
+
+def percentile(values, pct):
+    if not values:
+        return None
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(values):
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+    }
+
+
+def parse_server_timing(header):
+    stages = {}
+    for entry in filter(None, (e.strip() for e in header.split(","))):
+        name, _, rest = entry.partition(";dur=")
+        if rest:
+            stages[name] = float(rest) / 1000
+    return stages
+
+
+async def run_level(client, case, headers, concurrency, total):
+    # Only successful requests count towards latency and stages; a fast 503 from
+    # admission control would otherwise pull the percentiles down
+    latencies = []
+    stage_samples = {}
+    errors = 0
+    rejected = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors, rejected
+        while not queue.empty():
+            queue.get_nowait()
+            method, path, kwargs = case()
+            started = time.perf_counter()
+            response = await client.request(method, path, headers=headers, **kwargs)
+            elapsed = time.perf_counter() - started
+            if response.status_code == 503:
+                rejected += 1
+                continue
+            if response.status_code >= 400:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            for stage, seconds in parse_server_timing(response.headers.get("server-timing", "")).items():
+                stage_samples.setdefault(stage, []).append(seconds)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    return {
+        "requests": total,
+        "errors": errors,
+        "rejected": rejected,
+        "throughput_rps": round(len(latencies) / wall, 3) if wall else None,
+        "latency": summarize(latencies),
+        "stages": {stage: summarize(samples) for stage, samples in stage_samples.items()},
+    }
+
+
+async def run_benchmark(main, cases, headers, levels, total):
+    from backend import vision
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for name, case in cases.items():
+            results[name] = {}
+            for concurrency in levels:
+                vision.vision_cache.clear()
+                results[name][str(concurrency)] = await run_level(client, case, headers, concurrency, total)
+                level = results[name][str(concurrency)]
+                print(
+                    f"{name:<18} c={concurrency:<3} {level['throughput_rps']:>8} req/s  "
+                    f"p50={fmt(level['latency']['p50'])} p95={fmt(level['latency']['p95'])} "
+                    f"p99={fmt(level['latency']['p99'])} errors={level['errors']}"
+                )
+                if level["rejected"]:
+                    print(f"{'':<18} c={concurrency:<3} rejected with 503 by admission control: {level['rejected']}/{total}")
+    return results
+
+
+def fmt(seconds):
+    return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    print(f"\nComparison with {baseline_path} (p95, negative is faster):")
+    for name, levels in current.items():
+        for concurrency, level in levels.items():
+            old = baseline.get(name, {}).get(concurrency)
+            if not old or old["latency"]["p95"] is None or level["latency"]["p95"] is None:
+                continue
+            delta = (level["latency"]["p95"] - old["latency"]["p95"]) / old["latency"]["p95"] * 100
+            line = f"{name:<18} c={concurrency:<3} {fmt(old['latency']['p95'])} -> {fmt(level['latency']['p95'])} ({delta:+.1f}%)"
+            # Older result files predate the rejected count
+            if old.get("rejected", 0) or level["rejected"]:
+                line += f"  rejected {old.get('rejected', 0)} -> {level['rejected']}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the MultiScrapper backend")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="requests per endpoint per level")
+    parser.add_argument("--endpoints", default="", help="comma separated subset of endpoints")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="fake LLM base latency (s)")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=400, help="fake LLM output token rate")
+    parser.add_argument("--llm-output-tokens", type=int, default=200, help="fake LLM output length")
+    parser.add_argument("--transcript-latency", type=float, default=0.2)
+    parser.add_argument("--vision-latency", type=float, default=0.5)
+    parser.add_argument("--catalog-products", type=int, default=400, help="products on the fixture page")
+    parser.add_argument("--real-embeddings", action="store_true", help="load all-MiniLM-L6-v2 instead of fake embeddings")
+    parser.add_argument("--output-dir", default="bench_results")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    fixture_dir = tempfile.mkdtemp(prefix="multiscrapper-bench-")
+    html = make_catalog_html(args.catalog_products)
+    with open(os.path.join(fixture_dir, "catalog.html"), "w") as f:
+        f.write(html)
+    for size, pages in (("small", 2), ("medium", 20), ("large", 100)):
+        with open(os.path.join(fixture_dir, f"{size}.pdf"), "wb") as f:
+            f.write(make_pdf(pages))
+    make_screenshot(os.path.join(fixture_dir, "screenshot.png"))
+
+    server = serve_fixtures(fixture_dir)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    main_module = load_app(args, fixture_dir)
+    page_text = main_module.clean_body_content(html)
+    cases, headers = build_cases(fixture_dir, base_url, page_text)
+    if args.endpoints:
+        wanted = set(args.endpoints.split(","))
+        cases = {name: case for name, case in cases.items() if name in wanted}
+
+    levels = [int(level) for level in args.concurrency.split(",")]
+    try:
+        results = asyncio.run(run_benchmark(main_module, cases, headers, levels, args.requests))
+    finally:
+        server.shutdown()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump({"config": vars(args), "results": results}, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import os
+
+# Token-aware context packing. Instead of cutting prompts at fixed character counts,
+# we count tokens and fill a configurable budget capped by the resolved model's window.
+# Counts are an approximation: every model is measured with tiktoken's cl100k_base,
+# since exact Gemini counts need an API call per prompt.
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken is optional; fall back to the usual ~4 characters per token estimate
+    _encoding = None
+
+CHARS_PER_TOKEN = 4
+
+# Known context windows (in tokens) for the models get_llm can resolve to
+CONTEXT_WINDOWS = {
+    "gemini-2.0-flash": 1_048_576,
+    "gemini-2.0-flash-exp": 1_048_576,
+    "gemini-1.5-flash": 1_048_576,
+    "gemini-1.5-flash-latest": 1_048_576,
+    "gemini-1.5-flash-001": 1_048_576,
+    "gemini-1.5-pro": 2_097_152,
+    "gemini-pro": 30_720,
+    "gemini-1.0-pro": 30_720,
+    "llama-3.3-70b-versatile": 131_072,
+    "llama3-8b-8192": 8_192,
+}
+DEFAULT_CONTEXT_WINDOW = 30_720
+
+# Tokens kept free for the instructions and the model's answer
+RESPONSE_RESERVE = int(os.getenv("CONTEXT_RESPONSE_RESERVE", 2048))
+# Only this share of the window is filled, so tokenizer differences can't overflow it
+WINDOW_SAFETY_MARGIN = float(os.getenv("CONTEXT_WINDOW_SAFETY_MARGIN", 0.9))
+
+# Default budgets, overridable from the environment
+RAG_TOKEN_BUDGET = int(os.getenv("RAG_TOKEN_BUDGET", 4000))
+EXTRACT_TOKEN_BUDGET = int(os.getenv("EXTRACT_TOKEN_BUDGET", 8000))
+# Unset means "as much of the model's window as fits"
+SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET")) if os.getenv("SUMMARY_TOKEN_BUDGET") else None
+# The failover paths keep their old limits (~30000 and ~15000 characters)
+FALLBACK_SUMMARY_TOKEN_BUDGET = int(os.getenv("FALLBACK_SUMMARY_TOKEN_BUDGET", 7500))
+GROQ_SUMMARY_TOKEN_BUDGET = int(os.getenv("GROQ_SUMMARY_TOKEN_BUDGET", 3750))
+
+
+def model_name_of(llm):
+    """Returns the resolved model name of a LangChain chat model."""
+    name = getattr(llm, "model_name", None) or getattr(llm, "model", None) or ""
+    return name.replace("models/", "")
+
+
+def count_tokens(text):
+    """Approximate token count (cl100k_base, or ~4 characters per token without tiktoken)."""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def token_budget(model_name, requested=None):
+    """Caps the requested budget (None = no limit) to what fits in the model's context window."""
+    window = CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+    available = int((window - RESPONSE_RESERVE) * WINDOW_SAFETY_MARGIN)
+    if requested is None:
+        return max(0, available)
+    return max(0, min(requested, available))
+
+
+def truncate_to_tokens(text, max_tokens):
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:max_tokens])
+    return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+def fit_text(text, llm, requested):
+    """Truncates text to the budget for this llm. Returns (text, token_count)."""
+    budget = token_budget(model_name_of(llm), requested)
+    fitted = truncate_to_tokens(text, budget)
+    return fitted, count_tokens(fitted)
+
+
+def chunk_offsets(text, chunks):
+    """
+    Finds the (start, end) of each split chunk in the source text.
+    Raises ValueError for a chunk that isn't in the text, since a wrong offset would
+    make pack_context send an unrelated slice.
+    """
+    offsets = []
+    cursor = 0
+    for chunk in chunks:
+        start = text.find(chunk, cursor)
+        if start == -1:
+            start = text.find(chunk)
+        if start == -1:
+            raise ValueError(f"Chunk not found in source text: {chunk[:50]!r}")
+        offsets.append((start, start + len(chunk)))
+        cursor = start + 1
+    return offsets
+
+
+def pack_context(source_text, scored_spans, llm, requested=RAG_TOKEN_BUDGET):
+    """
+    Packs retrieved spans into a token budget.
+    scored_spans is a list of (start, end, score) offsets into source_text, where a
+    higher score is better. The best spans are taken first until the budget is full,
+    then overlapping or adjacent spans are merged so shared text is only sent once.
+    Returns (context, token_count).
+    """
+    budget = token_budget(model_name_of(llm), requested)
+    selected = []
+    used = 0
+    for start, end, _ in sorted(scored_spans, key=lambda s: s[2], reverse=True):
+        if any(start >= s and end <= e for s, e in selected):
+            continue  # already covered by a better span
+        cost = count_tokens(source_text[start:end])
+        if used + cost > budget:
+            continue
+        selected.append((start, end))
+        used += cost
+
+    merged = []
+    for start, end in sorted(selected):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    context = "\n\n".join(source_text[start:end] for start, end in merged)
+    return context, count_tokens(context)
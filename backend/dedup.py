@@ -0,0 +1,125 @@
+import hashlib
+import re
+
+# Scraped pages repeat a lot of boilerplate (cookie banners, menus, product cards).
+# After splitting, many chunks are identical or nearly identical, so we drop them
+# before embedding and keep a pointer from every dropped chunk to its canonical copy.
+
+SIMHASH_BITS = 64
+# Chunks whose simhashes differ in at most this many bits are near-duplicate candidates
+MAX_HAMMING_DISTANCE = 3
+# A candidate is only dropped if its word shingles overlap the canonical chunk's this much
+MIN_JACCARD = 0.9
+
+
+def _normalize(text):
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _words(text):
+    return re.findall(r"\w+", text)
+
+
+def _shingles(words, size=3):
+    if len(words) <= size:
+        return [" ".join(words)] if words else []
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+def simhash(text, bits=SIMHASH_BITS):
+    """Computes a SimHash fingerprint over word 3-gram shingles."""
+    weights = [0] * bits
+    for shingle in _shingles(_words(_normalize(text))):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=bits // 8).digest(), "big")
+        for i in range(bits):
+            weights[i] += 1 if (h >> i) & 1 else -1
+    fingerprint = 0
+    for i, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def _bands(fingerprint, bands, bits=SIMHASH_BITS):
+    # Two fingerprints within distance d agree exactly on at least one of d + 1 bands,
+    # so banding finds every candidate without comparing all pairs.
+    width = bits // bands
+    mask = (1 << width) - 1
+    return [(b, (fingerprint >> (b * width)) & mask) for b in range(bands)]
+
+
+def _is_near_duplicate(words, shingles, canonical_words, canonical_shingles, min_jaccard):
+    # Never drop a chunk that holds a word its canonical copy lacks (a SKU, a price, a name)
+    if not words <= canonical_words:
+        return False
+    union = shingles | canonical_shingles
+    return not union or len(shingles & canonical_shingles) / len(union) >= min_jaccard
+
+
+def dedup_chunks(chunks, max_distance=MAX_HAMMING_DISTANCE, min_jaccard=MIN_JACCARD):
+    """
+    Removes exact and near-duplicate chunks.
+    SimHash banding finds candidates; a candidate is only dropped when its shingle
+    Jaccard similarity is at least min_jaccard and all of its words already appear
+    in the canonical chunk, so chunks that share a template but differ in values stay.
+    Returns (kept_chunks, canonical, stats) where canonical[i] is the index in
+    kept_chunks of the copy that represents the original chunk i.
+    """
+    bands = min(max_distance + 1, SIMHASH_BITS)
+    kept = []
+    canonical = []
+    exact_index = {}
+    band_index = {}
+    fingerprints = []
+    kept_words = []
+    kept_shingles = []
+    exact_dupes = 0
+    near_dupes = 0
+
+    for chunk in chunks:
+        normalized = _normalize(chunk)
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        if digest in exact_index:
+            canonical.append(exact_index[digest])
+            exact_dupes += 1
+            continue
+
+        words = _words(normalized)
+        word_set = set(words)
+        shingle_set = set(_shingles(words))
+        fingerprint = simhash(chunk)
+        match = None
+        for band in _bands(fingerprint, bands):
+            for candidate in band_index.get(band, []):
+                if bin(fingerprint ^ fingerprints[candidate]).count("1") > max_distance:
+                    continue
+                if _is_near_duplicate(word_set, shingle_set, kept_words[candidate], kept_shingles[candidate], min_jaccard):
+                    match = candidate
+                    break
+            if match is not None:
+                break
+
+        if match is not None:
+            canonical.append(match)
+            near_dupes += 1
+            continue
+
+        position = len(kept)
+        kept.append(chunk)
+        fingerprints.append(fingerprint)
+        kept_words.append(word_set)
+        kept_shingles.append(shingle_set)
+        exact_index[digest] = position
+        for band in _bands(fingerprint, bands):
+            band_index.setdefault(band, []).append(position)
+        canonical.append(position)
+
+    total = len(chunks)
+    stats = {
+        "total_chunks": total,
+        "kept_chunks": len(kept),
+        "exact_duplicates": exact_dupes,
+        "near_duplicates": near_dupes,
+        "dedup_ratio": round((total - len(kept)) / total, 4) if total else 0.0,
+    }
+    return kept, canonical, stats
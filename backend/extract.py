@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import re
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .metrics import span
+from .context import count_tokens, token_budget, model_name_of, EXTRACT_TOKEN_BUDGET
+
+# Full-page structured extraction. The page is split into token-sized windows,
+# each window is extracted concurrently, and the rows are merged into one table.
+
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", 4))
+EXTRACT_WINDOW_OVERLAP = int(os.getenv("EXTRACT_WINDOW_OVERLAP", 200))
+
+DEFAULT_SCHEMA = "product names, prices, and features"
+
+EXTRACT_PROMPT = """Extract {schema} from the text below.
+Return ONLY a JSON array of objects, one object per item, using short lowercase keys
+(for example "name", "price", "features"). Use the same keys for every object.
+If there is nothing to extract, return [].
+
+Text:
+{text}"""
+
+
+def split_windows(text, llm, window_tokens=EXTRACT_TOKEN_BUDGET):
+    """Splits text into windows that each fit the llm's extraction budget."""
+    size = token_budget(model_name_of(llm), window_tokens)
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=size,
+        chunk_overlap=min(EXTRACT_WINDOW_OVERLAP, size // 4),
+        length_function=count_tokens,
+    )
+    return splitter.split_text(text)
+
+
+def parse_rows(content):
+    """Pulls the JSON array out of a model response, tolerating code fences and chatter."""
+    match = re.search(r"\[.*\]", content, re.DOTALL)
+    if not match:
+        return []
+    try:
+        rows = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return []
+    return [row for row in rows if isinstance(row, dict)]
+
+
+def _normalize(value):
+    if isinstance(value, list):
+        value = ", ".join(str(v) for v in value)
+    return re.sub(r"\s+", " ", str(value)).strip().lower()
+
+
+def _fill(kept, row):
+    for field, value in row.items():
+        if not kept.get(field) and value:
+            kept[field] = value
+
+
+def merge_rows(rows):
+    """
+    Deduplicates rows found in overlapping windows.
+    Rows with a name merge into an earlier row with the same name unless both have a
+    price and the prices differ, so a card cut at a window edge (name only) joins its
+    complete copy. Rows without a name are keyed on all their values.
+    Empty fields of the kept row are filled from later duplicates.
+    """
+    merged = []
+    by_name = {}
+    by_values = {}
+    for row in rows:
+        if "name" in row:
+            price = _normalize(row.get("price") or "")
+            candidates = by_name.setdefault(_normalize(row.get("name") or ""), [])
+            for kept in candidates:
+                kept_price = _normalize(kept.get("price") or "")
+                if not price or not kept_price or price == kept_price:
+                    _fill(kept, row)
+                    break
+            else:
+                candidates.append(dict(row))
+                merged.append(candidates[-1])
+            continue
+
+        key = tuple(sorted((k, _normalize(v)) for k, v in row.items()))
+        if key in by_values:
+            _fill(by_values[key], row)
+        else:
+            by_values[key] = dict(row)
+            merged.append(by_values[key])
+    return merged
+
+
+def rows_to_markdown(rows):
+    if not rows:
+        return "No structured data found."
+    columns = []
+    for row in rows:
+        for field in row:
+            if field not in columns:
+                columns.append(field)
+
+    def cell(value):
+        if isinstance(value, list):
+            value = ", ".join(str(v) for v in value)
+        return str(value if value is not None else "").replace("|", "\\|").replace("\n", " ")
+
+    lines = [
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join("---" for _ in columns) + " |",
+    ]
+    for row in rows:
+        lines.append("| " + " | ".join(cell(row.get(c, "")) for c in columns) + " |")
+    return "\n".join(lines)
+
+
+async def extract_rows(text, llm, schema=DEFAULT_SCHEMA, concurrency=EXTRACT_CONCURRENCY):
+    """
+    Runs extraction over every window of the page, at most `concurrency` calls at once.
+    A failed window (e.g. a 429) is counted in stats["failed_windows"] and the rows of
+    the other windows are still returned; only if every window fails is the error raised.
+    Returns (rows, stats).
+    """
+    windows = split_windows(text, llm)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(window):
+        async with semaphore:
+            prompt = EXTRACT_PROMPT.format(schema=schema, text=window)
+            with span("llm"):
+                response = await llm.ainvoke(prompt)
+            return parse_rows(response.content), count_tokens(prompt)
+
+    outcomes = await asyncio.gather(*(run(window) for window in windows), return_exceptions=True)
+    failures = [outcome for outcome in outcomes if isinstance(outcome, BaseException)]
+    results = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+    if failures and not results:
+        raise failures[0]
+    for error in failures:
+        print(f"Extraction window failed: {error}")
+
+    all_rows = [row for rows, _ in results for row in rows]
+    rows = merge_rows(all_rows)
+    stats = {
+        "windows": len(windows),
+        "failed_windows": len(failures),
+        "rows_found": len(all_rows),
+        "rows_merged": len(rows),
+        "tokens_sent": sum(tokens for _, tokens in results),
+    }
+    return rows, stats
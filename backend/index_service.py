@@ -0,0 +1,226 @@
+"""
+Embedding and vector-index service.
+
+By default the API process holds the embedding model and indexes itself (LocalIndex).
+For multi-worker deployments run one sidecar that owns the single model copy and the
+shared indexes, and point the HTTP workers at it with INDEX_SERVICE_SOCKET. Requests are
+pickled, so the service and the workers must share a random INDEX_SERVICE_AUTHKEY
+(start.sh generates one):
+
+    export INDEX_SERVICE_AUTHKEY=$(head -c32 /dev/urandom | base64)
+    python -m backend.index_service --socket /tmp/multiscrapper-index.sock
+"""
+import argparse
+import os
+import threading
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener
+
+from .metrics import forward_observations, record_coalesced, replay_observations, span
+
+EMBEDDINGS_MODEL = os.getenv("EMBEDDINGS_MODEL", "all-MiniLM-L6-v2")
+# Number of document indexes kept in memory, least recently used evicted first
+INDEX_CACHE_SIZE = int(os.getenv("INDEX_CACHE_SIZE", 8))
+
+
+def service_authkey():
+    """The shared secret for the index socket. There is deliberately no default."""
+    key = os.getenv("INDEX_SERVICE_AUTHKEY")
+    if not key:
+        raise RuntimeError(
+            "INDEX_SERVICE_AUTHKEY is not set. Set it to the same random secret for the "
+            "index service and the workers, e.g. $(head -c32 /dev/urandom | base64)."
+        )
+    return key.encode()
+
+
+class LocalIndex:
+    """Holds FAISS indexes keyed by text hash, plus a small shared key/value cache."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.stores = OrderedDict()
+        self.values = {}
+        self.lock = threading.Lock()
+        # text_hash -> [lock held while that index is built, callers using the lock],
+        # so every worker asking for the same document waits for one build
+        self.building = {}
+
+    def info(self, text_hash):
+        """Returns the info stored with an index, or None if it isn't built."""
+        with self.lock:
+            if text_hash not in self.stores:
+                return None
+            self.stores.move_to_end(text_hash)
+            return self.stores[text_hash][1]
+
+    def _build(self, text_hash, chunks, metadatas, info):
+        from langchain_community.vectorstores import FAISS
+
+        with self.lock:
+            entry = self.building.setdefault(text_hash, [threading.Lock(), 0])
+            entry[1] += 1
+        with entry[0]:
+            try:
+                with self.lock:
+                    if text_hash in self.stores:
+                        # Built by a concurrent caller while we waited
+                        record_coalesced("index_service_build")
+                        self.stores.move_to_end(text_hash)
+                        return self.stores[text_hash][0]
+
+                with span("embed"):
+                    vectors = self.embeddings.embed_documents(chunks)
+                with span("index_build"):
+                    store = FAISS.from_embeddings(list(zip(chunks, vectors)), self.embeddings, metadatas=metadatas)
+                with self.lock:
+                    self.stores[text_hash] = (store, info or {})
+                    self.stores.move_to_end(text_hash)
+                    while len(self.stores) > INDEX_CACHE_SIZE:
+                        self.stores.popitem(last=False)
+            finally:
+                with self.lock:
+                    entry[1] -= 1
+                    if entry[1] == 0:
+                        del self.building[text_hash]
+        return store
+
+    @staticmethod
+    def _search(store, query, k):
+        return [(doc.metadata, float(distance)) for doc, distance in store.similarity_search_with_score(query, k=k)]
+
+    def build(self, text_hash, chunks, metadatas, info=None):
+        self._build(text_hash, chunks, metadatas, info)
+
+    def search(self, text_hash, query, k):
+        """Returns [(metadata, distance)] for the k nearest chunks, or None if the index isn't built."""
+        with self.lock:
+            # Other documents may have evicted it since the caller checked info()
+            if text_hash not in self.stores:
+                return None
+            self.stores.move_to_end(text_hash)
+            store = self.stores[text_hash][0]
+        return self._search(store, query, k)
+
+    def build_and_search(self, text_hash, chunks, metadatas, info, query, k):
+        """Builds the index and searches the new store directly, so eviction can't race the search."""
+        return self._search(self._build(text_hash, chunks, metadatas, info), query, k)
+
+    def get_value(self, key):
+        with self.lock:
+            return self.values.get(key)
+
+    def set_value(self, key, value):
+        with self.lock:
+            self.values[key] = value
+
+
+class RemoteIndex:
+    """Same interface as LocalIndex, forwarded to the sidecar over a Unix socket."""
+
+    def __init__(self, socket_path, authkey=None):
+        self.socket_path = socket_path
+        self.authkey = authkey or service_authkey()
+        # One connection per thread, since a connection can't be shared mid-call
+        self.local = threading.local()
+
+    def _connection(self):
+        if getattr(self.local, "conn", None) is None:
+            self.local.conn = Client(self.socket_path, family="AF_UNIX", authkey=self.authkey)
+        return self.local.conn
+
+    def _call(self, op, *args):
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.send((op, args))
+                status, result, observations = conn.recv()
+                break
+            except (EOFError, OSError):
+                # The service restarted; reconnect once
+                self.local.conn = None
+                if attempt:
+                    raise
+        # Stage timings measured in the service show up in this worker's /metrics and Server-Timing
+        replay_observations(observations)
+        if status == "error":
+            raise RuntimeError(f"Index service error: {result}")
+        return result
+
+    def info(self, text_hash):
+        return self._call("info", text_hash)
+
+    def build(self, text_hash, chunks, metadatas, info=None):
+        with span("index_service"):
+            return self._call("build", text_hash, chunks, metadatas, info)
+
+    def search(self, text_hash, query, k):
+        return self._call("search", text_hash, query, k)
+
+    def build_and_search(self, text_hash, chunks, metadatas, info, query, k):
+        with span("index_service"):
+            return self._call("build_and_search", text_hash, chunks, metadatas, info, query, k)
+
+    def get_value(self, key):
+        return self._call("get_value", key)
+
+    def set_value(self, key, value):
+        return self._call("set_value", key, value)
+
+
+OPERATIONS = ("info", "build", "search", "build_and_search", "get_value", "set_value")
+
+
+def _handle(conn, index):
+    with conn:
+        while True:
+            try:
+                op, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            with forward_observations() as observations:
+                try:
+                    if op not in OPERATIONS:
+                        raise ValueError(f"Unknown operation: {op}")
+                    reply = ("ok", getattr(index, op)(*args))
+                except Exception as e:
+                    reply = ("error", str(e))
+            conn.send((*reply, observations))
+
+
+def listen(socket_path, authkey):
+    """Binds the service socket, owner-only from the start instead of tightened after bind."""
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    previous_umask = os.umask(0o177)
+    try:
+        return Listener(socket_path, family="AF_UNIX", authkey=authkey)
+    finally:
+        os.umask(previous_umask)
+
+
+def serve(socket_path, authkey=None):
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    authkey = authkey or service_authkey()
+
+    print(f"Index service: loading {EMBEDDINGS_MODEL}...")
+    index = LocalIndex(HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL))
+
+    listener = listen(socket_path, authkey)
+    print(f"Index service listening on {socket_path}")
+
+    while True:
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            print(f"Index service: rejected connection ({e})")
+            continue
+        threading.Thread(target=_handle, args=(conn, index), daemon=True).start()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shared embedding/index service for multi-worker deployments")
+    parser.add_argument("--socket", default=os.getenv("INDEX_SERVICE_SOCKET", "/tmp/multiscrapper-index.sock"))
+    args = parser.parse_args()
+    serve(args.socket)
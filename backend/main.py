@@ -3,44 +3,57 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load env vars from .env file
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional, List
 import uvicorn
 import io
 import re
+import hashlib
 
 # We can reuse our logic from the root folder by importing or copying
 # For a clean fullstack app, I'll put the core logic here or in a utils file.
 
-from .scraper import scrape_website, clean_body_content
-from PIL import Image
+from .scraper import scrape_website, clean_body_content, screenshot_path
+from .dedup import dedup_chunks
+from .context import (
+    pack_context, chunk_offsets, fit_text, count_tokens,
+    RAG_TOKEN_BUDGET, EXTRACT_TOKEN_BUDGET, SUMMARY_TOKEN_BUDGET,
+    FALLBACK_SUMMARY_TOKEN_BUDGET, GROQ_SUMMARY_TOKEN_BUDGET,
+)
+from .extract import extract_rows, rows_to_markdown
+from .vision import analyze_image_async
+from .metrics import span, record_failover, timing_middleware, metrics_payload, to_thread
+from .index_service import LocalIndex, RemoteIndex, EMBEDDINGS_MODEL
+from .singleflight import SingleFlight
+from .admission import AdmissionLimiter
 import base64
 
 from youtube_transcript_api import YouTubeTranscriptApi
 from PyPDF2 import PdfReader
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
-from langchain_community.vectorstores import FAISS
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_classic.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
 from langchain_huggingface import HuggingFaceEmbeddings
 
-# Initialize embeddings once at startup to save time on each request
-print("Initializing HuggingFace Embeddings (this may take a moment)...")
-embeddings_model = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-print("Embeddings loaded.")
+# With several workers, INDEX_SERVICE_SOCKET points at the shared index service so the
+# embedding model and vector indexes live in one process instead of one copy per worker.
+INDEX_SERVICE_SOCKET = os.getenv("INDEX_SERVICE_SOCKET")
 
-# Global cache for vector store to avoid rebuilding it on every question
-# In production, use Redis or a session-based storage.
-vector_store_cache = {
-    "text_hash": None,
-    "store": None
-}
+if INDEX_SERVICE_SOCKET:
+    print(f"Using shared index service at {INDEX_SERVICE_SOCKET}")
+    vector_index = RemoteIndex(INDEX_SERVICE_SOCKET)
+else:
+    # Initialize embeddings once at startup to save time on each request
+    print("Initializing HuggingFace Embeddings (this may take a moment)...")
+    embeddings_model = HuggingFaceEmbeddings(model_name=EMBEDDINGS_MODEL)
+    print("Embeddings loaded.")
+    # Vector stores are cached by text hash to avoid rebuilding them on every question
+    vector_index = LocalIndex(embeddings_model)
 
 app = FastAPI(title="MultiScrapper AI Pro API")
 
@@ -50,8 +63,12 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# Per-stage spans -> Prometheus histograms and Server-Timing headers
+app.middleware("http")(timing_middleware)
+
 # --- Models ---
 class YouTubeRequest(BaseModel):
     url: str
@@ -63,8 +80,53 @@ class WebRequest(BaseModel):
     mode: str = "Smart Q&A (RAG)"
 
 # --- Utilities ---
-# Global cache for valid model names to avoid repeated API calls
-valid_model_cache = {}
+# How many chunks to pull from FAISS before packing them into the token budget
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 8))
+
+QA_CHAIN_PROMPT = PromptTemplate.from_template("""Use the context to answer. Context: {context} Question: {question}""")
+
+def answer_from_index(llm, text, text_hash, question):
+    """Retrieves candidate chunks, packs them into the model's token budget and asks the LLM."""
+    with span("retrieve"):
+        results = vector_index.search(text_hash, question, RETRIEVAL_CANDIDATES)
+    if results is None:
+        # Evicted by other documents since the caller checked; rebuild and search in one
+        # step so it can't be evicted again in between
+        print("Vector store was evicted before the search. Rebuilding...")
+        chunks, metadatas, dedup_stats = prepare_chunks(text)
+        with span("retrieve"):
+            results = vector_index.build_and_search(text_hash, chunks, metadatas, dedup_stats, question, RETRIEVAL_CANDIDATES)
+    # FAISS returns L2 distances, so a smaller distance is a better match
+    spans = [(metadata["start"], metadata["end"], -distance) for metadata, distance in results]
+    context, _ = pack_context(text, spans, llm, RAG_TOKEN_BUDGET)
+    prompt = QA_CHAIN_PROMPT.format(context=context, question=question)
+    with span("llm"):
+        response = llm.invoke(prompt)
+    return response.content, count_tokens(prompt)
+
+# Valid model names are cached to avoid repeated API calls: per worker, and shared through
+# the index service when there is one. The per-worker copy keeps endpoints that never touch
+# an index working while the service is down.
+valid_models = {}
+
+def cached_model_name(google_api_key):
+    if google_api_key in valid_models:
+        return valid_models[google_api_key]
+    try:
+        model_name = vector_index.get_value(f"valid_model:{google_api_key}")
+    except Exception as e:
+        print(f"Warning: could not read the shared model cache ({e}).")
+        return None
+    if model_name:
+        valid_models[google_api_key] = model_name
+    return model_name
+
+def remember_model_name(google_api_key, model_name):
+    valid_models[google_api_key] = model_name
+    try:
+        vector_index.set_value(f"valid_model:{google_api_key}", model_name)
+    except Exception as e:
+        print(f"Warning: could not update the shared model cache ({e}).")
 
 def get_llm(provider: str, google_api_key: str = None, groq_api_key: str = None):
     # Groq handling remains the same
@@ -75,8 +137,8 @@ def get_llm(provider: str, google_api_key: str = None, groq_api_key: str = None)
         import google.generativeai as genai
         
         # Check cache first
-        if google_api_key in valid_model_cache:
-            verified_model = valid_model_cache[google_api_key]
+        verified_model = cached_model_name(google_api_key)
+        if verified_model:
             return ChatGoogleGenerativeAI(model=verified_model, google_api_key=google_api_key, temperature=0.3)
 
         genai.configure(api_key=google_api_key)
@@ -131,7 +193,7 @@ def get_llm(provider: str, google_api_key: str = None, groq_api_key: str = None)
             final_model = "gemini-1.5-flash"
             
         print(f"Selected validated model: {final_model}")
-        valid_model_cache[google_api_key] = final_model
+        remember_model_name(google_api_key, final_model)
         
         return ChatGoogleGenerativeAI(
             model=final_model, 
@@ -142,9 +204,100 @@ def get_llm(provider: str, google_api_key: str = None, groq_api_key: str = None)
     
     raise HTTPException(status_code=400, detail="No valid API key provided for selected model")
 
+def fetch_transcript_text(video_id):
+    # The installed version of youtube-transcript-api (1.2.4) requires an instance
+    yt_api = YouTubeTranscriptApi()
+    
+    # Try to get English transcript first (manual or auto), then fall back to others
+    with span("transcript"):
+        try:
+            # fetch() on the instance is the equivalent of get_transcript
+            data = yt_api.fetch(video_id, languages=['en'])
+        except Exception:
+            # If English fails, try to list all available and pick the first one
+            transcript_list = yt_api.list(video_id)
+            # Try to find any English transcript (manual or generated)
+            try:
+                transcript = transcript_list.find_transcript(['en'])
+            except Exception:
+                # If no English, just take the first available one
+                transcript = next(iter(transcript_list))
+            data = transcript.fetch()
+    
+    # Fix: data is a list of objects, not dicts. Access .text attribute directly.
+    return " ".join([item.text for item in data])
+
+def prepare_chunks(text):
+    """Splits and dedups text. Returns (chunks, metadatas, dedup_stats)."""
+    with span("split"):
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        chunks = text_splitter.split_text(text)
+    print(f"Split text into {len(chunks)} chunks.")
+
+    # Keep each chunk's position so retrieved neighbours can be merged when packing
+    offsets = chunk_offsets(text, chunks)
+
+    # Drop boilerplate repeats so they don't get embedded or crowd out retrieval
+    with span("dedup"):
+        kept_chunks, canonical, dedup_stats = dedup_chunks(chunks)
+    print(f"Dedup kept {dedup_stats['kept_chunks']}/{dedup_stats['total_chunks']} chunks (ratio {dedup_stats['dedup_ratio']}).")
+
+    # Each kept chunk records the offsets of the dropped copies it stands in for
+    metadatas = [None] * len(kept_chunks)
+    for (start, end), position in zip(offsets, canonical):
+        if metadatas[position] is None:
+            metadatas[position] = {"start": start, "end": end, "duplicates": []}
+        else:
+            metadatas[position]["duplicates"].append([start, end])
+    return kept_chunks, metadatas, dedup_stats
+
+def build_index(text, text_hash):
+    """Splits, dedups and indexes text under text_hash. Returns the dedup stats."""
+    print("Building new vector store...")
+    chunks, metadatas, dedup_stats = prepare_chunks(text)
+
+    # Embed with the shared model and cache the index under the text hash
+    vector_index.build(text_hash, chunks, metadatas, dedup_stats)
+    print("Vector store created and cached.")
+    return dedup_stats
+
+# Identical concurrent scrapes, transcript fetches and index builds share one call.
+# This is per worker; the index service also coalesces builds across workers by text hash.
+scrape_flight = SingleFlight("scrape")
+transcript_flight = SingleFlight("transcript")
+index_flight = SingleFlight("index_build")
+
+# Per-endpoint concurrency limits and bounded wait queues (overridable from the environment).
+# They are totals for the instance, shared by all WEB_CONCURRENCY workers.
+# Scraping launches Chrome, so it gets the tightest limit.
+scrape_limiter = AdmissionLimiter("scrape", limit=2, queue_size=8)
+youtube_limiter = AdmissionLimiter("youtube", limit=8, queue_size=32)
+pdf_limiter = AdmissionLimiter("pdf", limit=4, queue_size=16)
+ask_limiter = AdmissionLimiter("ask", limit=8, queue_size=32)
+vision_limiter = AdmissionLimiter("vision", limit=4, queue_size=16)
+extract_limiter = AdmissionLimiter("extract", limit=4, queue_size=16)
+
+def extract_pdf_text(contents):
+    """Returns (text, page_count) for an uploaded PDF."""
+    with span("pdf_extract"):
+        pdf_reader = PdfReader(io.BytesIO(contents))
+        
+        raw_text = ""
+        for page in pdf_reader.pages:
+            page_text = page.extract_text()
+            if page_text:
+                # Clean up extracted text: replace multiple newlines/spaces with a single space
+                # but keep double newlines for paragraph separation
+                cleaned_page = re.sub(r'(?<!\n)\n(?!\n)', ' ', page_text)
+                raw_text += cleaned_page + "\n\n"
+        
+        # Final pass to remove excessive whitespace
+        final_text = re.sub(r' +', ' ', raw_text).strip()
+    return final_text, len(pdf_reader.pages)
+
 # --- Endpoints ---
 
-@app.post("/api/youtube")
+@app.post("/api/youtube", dependencies=[Depends(youtube_limiter.slot)])
 async def summarize_youtube(
     request: YouTubeRequest, 
     x_google_api_key: Optional[str] = Header(None),
@@ -160,26 +313,8 @@ async def summarize_youtube(
         print(f"Fetching transcript for: {video_id}")
         text = ""
         try:
-            # The installed version of youtube-transcript-api (1.2.4) requires an instance
-            yt_api = YouTubeTranscriptApi()
-            
-            # Try to get English transcript first (manual or auto), then fall back to others
-            try:
-                # fetch() on the instance is the equivalent of get_transcript
-                data = yt_api.fetch(video_id, languages=['en'])
-            except Exception:
-                # If English fails, try to list all available and pick the first one
-                transcript_list = yt_api.list(video_id)
-                # Try to find any English transcript (manual or generated)
-                try:
-                    transcript = transcript_list.find_transcript(['en'])
-                except Exception:
-                    # If no English, just take the first available one
-                    transcript = next(iter(transcript_list))
-                data = transcript.fetch()
-            
-            # Fix: data is a list of objects, not dicts. Access .text attribute directly.
-            text = " ".join([item.text for item in data])
+            # Concurrent requests for the same video share one fetch
+            text = await transcript_flight.do(video_id, lambda: to_thread(fetch_transcript_text, video_id))
             print(f"Transcript fetched. Length: {len(text)} characters.")
             
         except Exception as transcript_err:
@@ -191,15 +326,21 @@ async def summarize_youtube(
         
         # Smart Fallback Logic
         try:
-            llm = get_llm(request.provider, x_google_api_key, x_groq_api_key)
-            prompt = f"Summarize this video transcript with key takeaways and timestamp-style headings: {text}"
-            response = llm.invoke(prompt)
+            llm = await to_thread(get_llm, request.provider, x_google_api_key, x_groq_api_key)
+            transcript, _ = fit_text(text, llm, SUMMARY_TOKEN_BUDGET)
+            prompt = f"Summarize this video transcript with key takeaways and timestamp-style headings: {transcript}"
+            with span("llm"):
+                response = await to_thread(llm.invoke, prompt)
         except Exception as e:
             if "404" in str(e) or "NOT_FOUND" in str(e):
                 print("Model not found. Trying fallback model...")
+                record_failover("model_not_found")
                 # Fallback to gemini-pro if flash fails
-                llm = ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=x_google_api_key)
-                response = llm.invoke(f"Summarize this: {text[:30000]}") # Truncate for safety
+                with span("failover"):
+                    llm = ChatGoogleGenerativeAI(model="gemini-pro", google_api_key=x_google_api_key)
+                    transcript, _ = fit_text(text, llm, FALLBACK_SUMMARY_TOKEN_BUDGET)
+                    prompt = f"Summarize this: {transcript}"
+                    response = await to_thread(llm.invoke, prompt)
             elif "429" in str(e) or "RESOURCE_EXHAUSTED" in str(e):
                  print("Gemini limit reached. Checking for Groq fallback...")
                  
@@ -208,9 +349,13 @@ async def summarize_youtube(
                  
                  if local_groq:
                      print("Falling back to Groq (Llama 3)...")
-                     llm = get_llm("Groq (Llama 3)", x_google_api_key, local_groq)
-                     # GroqContext window might be smaller, truncate harder just in case
-                     response = llm.invoke(f"Summarize this video transcript with key takeaways: {text[:15000]}")
+                     record_failover("rate_limited")
+                     with span("failover"):
+                         llm = await to_thread(get_llm, "Groq (Llama 3)", x_google_api_key, local_groq)
+                         # Groq's context and rate limits are smaller, so keep the old tighter cut
+                         transcript, _ = fit_text(text, llm, GROQ_SUMMARY_TOKEN_BUDGET)
+                         prompt = f"Summarize this video transcript with key takeaways: {transcript}"
+                         response = await to_thread(llm.invoke, prompt)
                  else:
                      raise HTTPException(
                          status_code=429, 
@@ -221,35 +366,24 @@ async def summarize_youtube(
         
         # Strip asterisks as requested by user
         clean_summary = response.content.replace("*", "")
-        return {"summary": clean_summary}
+        tokens_sent = count_tokens(prompt)
+        print(f"Summary prompt used {tokens_sent} tokens.")
+        return {"summary": clean_summary, "tokens_sent": tokens_sent}
     except Exception as e:
         error_msg = str(e)
         print(f"ERROR in summarize_youtube: {error_msg}")
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.post("/api/pdf/vectorize")
+@app.post("/api/pdf/vectorize", dependencies=[Depends(pdf_limiter.slot)])
 async def vectorize_pdf(file: UploadFile = File(...)):
     try:
         contents = await file.read()
-        pdf_reader = PdfReader(io.BytesIO(contents))
-        
-        raw_text = ""
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                # Clean up extracted text: replace multiple newlines/spaces with a single space
-                # but keep double newlines for paragraph separation
-                cleaned_page = re.sub(r'(?<!\n)\n(?!\n)', ' ', page_text)
-                raw_text += cleaned_page + "\n\n"
-        
-        # Final pass to remove excessive whitespace
-        final_text = re.sub(r' +', ' ', raw_text).strip()
-        
-        return {"text": final_text, "page_count": len(pdf_reader.pages)}
+        final_text, page_count = await to_thread(extract_pdf_text, contents)
+        return {"text": final_text, "page_count": page_count}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/ask")
+@app.post("/api/ask", dependencies=[Depends(ask_limiter.slot)])
 async def ask_question(
     text: str = Form(...),
     question: str = Form(...),
@@ -260,48 +394,31 @@ async def ask_question(
     try:
         print(f"Starting Q&A for question: {question[:50]}...")
         
-        import hashlib
         text_hash = hashlib.md5(text.encode()).hexdigest()
 
         # Check if we can reuse the vector store
-        global vector_store_cache
-        if vector_store_cache["text_hash"] == text_hash:
+        dedup_stats = await to_thread(vector_index.info, text_hash)
+        if dedup_stats is not None:
             print("Reusing cached vector store.")
-            vector_store = vector_store_cache["store"]
         else:
-            print("Building new vector store...")
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-            chunks = text_splitter.split_text(text)
-            print(f"Split text into {len(chunks)} chunks.")
-            
-            # Use the global embeddings model
-            vector_store = FAISS.from_texts(chunks, embeddings_model)
-            vector_store_cache["text_hash"] = text_hash
-            vector_store_cache["store"] = vector_store
-            print("Vector store created and cached.")
+            dedup_stats = await index_flight.do(text_hash, lambda: to_thread(build_index, text, text_hash))
         
         # LLM Chain with Fallback
         try:
-            llm = get_llm(provider, x_google_api_key, x_groq_api_key)
-            template = """Use the context to answer. Context: {context} Question: {question}"""
-            QA_CHAIN_PROMPT = PromptTemplate.from_template(template)
-            qa_chain = RetrievalQA.from_chain_type(
-                llm,
-                retriever=vector_store.as_retriever(search_kwargs={"k": 3}),
-                chain_type_kwargs={"prompt": QA_CHAIN_PROMPT}
-            )
-            response = qa_chain.invoke(question)
+            llm = await to_thread(get_llm, provider, x_google_api_key, x_groq_api_key)
+            answer, tokens_sent = await to_thread(answer_from_index, llm, text, text_hash, question)
         except Exception as e:
             if ("429" in str(e) or "RESOURCE_EXHAUSTED" in str(e)) and x_groq_api_key:
                 print("Gemini limit reached. Falling back to Groq...")
-                llm = get_llm("Groq (Llama 3)", x_google_api_key, x_groq_api_key)
-                qa_chain = RetrievalQA.from_chain_type(llm, retriever=vector_store.as_retriever())
-                response = qa_chain.invoke(question)
+                record_failover("rate_limited")
+                with span("failover"):
+                    llm = await to_thread(get_llm, "Groq (Llama 3)", x_google_api_key, x_groq_api_key)
+                    answer, tokens_sent = await to_thread(answer_from_index, llm, text, text_hash, question)
             else:
                 raise e
 
-        print("AI Response generated.")
-        return {"answer": response['result'].replace("*", "")}
+        print(f"AI Response generated. Prompt used {tokens_sent} tokens.")
+        return {"answer": answer.replace("*", ""), "dedup": dedup_stats, "tokens_sent": tokens_sent}
     except Exception as e:
         error_msg = str(e)
         if "429" in error_msg:
@@ -309,16 +426,18 @@ async def ask_question(
         print(f"ERROR in ask_question: {error_msg}")
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.post("/api/web/scrape")
+@app.post("/api/web/scrape", dependencies=[Depends(scrape_limiter.slot)])
 async def scrape_web(request: WebRequest):
     try:
-        html, screenshot = scrape_website(request.url)
-        text = clean_body_content(html)
-        return {"text": text, "screenshot": screenshot}
+        # Concurrent scrapes of the same URL share one Chrome session
+        html, screenshot_key, screenshot = await scrape_flight.do(request.url, lambda: to_thread(scrape_website, request.url))
+        with span("clean"):
+            text = clean_body_content(html)
+        return {"text": text, "screenshot": screenshot, "screenshot_key": screenshot_key}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/web/vision")
+@app.post("/api/web/vision", dependencies=[Depends(vision_limiter.slot)])
 async def analyze_vision(
     image_path: str = Form(...),
     prompt: str = Form(...),
@@ -331,32 +450,58 @@ async def analyze_vision(
     genai.configure(api_key=x_google_api_key)
     
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash')
-        img = Image.open(image_path)
-        response = model.generate_content([prompt, img])
-        return {"analysis": response.text}
+        model_name = 'gemini-2.0-flash'
+        model = genai.GenerativeModel(model_name)
+        with span("vision"):
+            analysis, stats = await analyze_image_async(model, model_name, image_path, prompt)
+        print(f"Vision call: {stats}")
+        return {"analysis": analysis, "vision": stats}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/web/extract")
+@app.post("/api/web/extract", dependencies=[Depends(extract_limiter.slot)])
 async def extract_table(
     text: str = Form(...),
     provider: str = Form("Gemini (Flash 2.0)"),
+    full_page: bool = Form(False),
+    output_format: str = Form("markdown"),
     x_google_api_key: Optional[str] = Header(None),
     x_groq_api_key: Optional[str] = Header(None)
 ):
-    llm = get_llm(provider, x_google_api_key, x_groq_api_key)
-    prompt = f"Extract product names, prices, and features into a markdown table from this text:\n\n{text[:8000]}"
+    llm = await to_thread(get_llm, provider, x_google_api_key, x_groq_api_key)
+
+    if full_page:
+        # Extract every window of the page concurrently and merge the rows
+        try:
+            rows, stats = await extract_rows(text, llm)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        print(f"Full-page extraction: {stats}")
+        result = {"rows": rows, "tokens_sent": stats["tokens_sent"], "extraction": stats}
+        if output_format == "markdown":
+            result["table"] = rows_to_markdown(rows)
+        return result
+
+    page_text, _ = fit_text(text, llm, EXTRACT_TOKEN_BUDGET)
+    prompt = f"Extract product names, prices, and features into a markdown table from this text:\n\n{page_text}"
     try:
-        response = llm.invoke(prompt)
-        return {"table": response.content}
+        with span("llm"):
+            response = await to_thread(llm.invoke, prompt)
+        return {"table": response.content, "tokens_sent": count_tokens(prompt)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def metrics():
+    payload, content_type = metrics_payload()
+    return Response(content=payload, media_type=content_type)
+
 @app.get("/api/web/screenshot")
-async def get_screenshot():
-    if os.path.exists("page.png"):
-        return FileResponse("page.png")
+async def get_screenshot(key: str):
+    # key is the screenshot_key returned by /api/web/scrape
+    path = screenshot_path(key)
+    if path and os.path.exists(path):
+        return FileResponse(path)
     raise HTTPException(status_code=404, detail="No screenshot available")
 
 if __name__ == "__main__":
@@ -0,0 +1,208 @@
+import asyncio
+import cProfile
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+# Per-stage timing. Every span is observed in a Prometheus histogram and, when it
+# happens inside a request, also collected for that request's Server-Timing header.
+
+STAGE_SECONDS = Histogram(
+    "multiscrapper_stage_seconds",
+    "Time spent in each pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUEST_SECONDS = Histogram(
+    "multiscrapper_request_seconds",
+    "End-to-end request latency",
+    ["method", "endpoint"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+REQUESTS_TOTAL = Counter(
+    "multiscrapper_requests_total",
+    "Requests handled",
+    ["method", "endpoint", "status"],
+)
+FAILOVERS_TOTAL = Counter(
+    "multiscrapper_failovers_total",
+    "LLM provider failovers",
+    ["reason"],
+)
+COALESCED_TOTAL = Counter(
+    "multiscrapper_coalesced_requests_total",
+    "Requests that joined an identical in-flight call instead of starting their own",
+    ["flight"],
+)
+INFLIGHT_CALLS = Gauge(
+    "multiscrapper_inflight_calls",
+    "Distinct expensive calls currently running",
+    ["flight"],
+)
+ADMISSION_ACTIVE = Gauge(
+    "multiscrapper_admission_active",
+    "Requests currently holding an admission slot",
+    ["endpoint"],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "multiscrapper_admission_queue_depth",
+    "Requests waiting for an admission slot",
+    ["endpoint"],
+)
+ADMISSION_REJECTED_TOTAL = Counter(
+    "multiscrapper_admission_rejected_total",
+    "Requests rejected with 503 by admission control",
+    ["endpoint", "reason"],
+)
+
+# Per-request profiling is opt-in: set PROFILING_ENABLED=1 and send "X-Profile: 1".
+# A request's real work runs in worker threads (see to_thread), so that is what gets
+# profiled; the event loop thread is shared with every other request.
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+_request_spans = ContextVar("request_spans", default=None)
+# Set while the index service handles a call for a worker. The service has no /metrics of
+# its own, so its observations are sent back with the reply and replayed by the worker.
+_forwarded = ContextVar("forwarded_observations", default=None)
+# Finished per-thread profiles of the request being profiled
+_request_profiles = ContextVar("request_profiles", default=None)
+# Only one request is profiled at a time, to keep the overhead bounded
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def span(stage):
+    """Times a block of work as `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage, elapsed):
+    """Records a finished stage in the histogram, the request's spans and any forwarding."""
+    STAGE_SECONDS.labels(stage).observe(elapsed)
+    spans = _request_spans.get()
+    if spans is not None:
+        spans.append((stage, elapsed))
+    forwarded = _forwarded.get()
+    if forwarded is not None:
+        forwarded.append(("stage", stage, elapsed))
+
+
+def record_coalesced(flight):
+    """Counts a caller that joined an identical in-flight call instead of starting its own."""
+    COALESCED_TOTAL.labels(flight).inc()
+    forwarded = _forwarded.get()
+    if forwarded is not None:
+        forwarded.append(("coalesced", flight))
+
+
+@contextmanager
+def forward_observations():
+    """Collects the observations made in this block so they can be sent to the caller."""
+    observations = []
+    token = _forwarded.set(observations)
+    try:
+        yield observations
+    finally:
+        _forwarded.reset(token)
+
+
+def replay_observations(observations):
+    """Records observations forwarded from another process as if they happened here."""
+    for kind, *args in observations:
+        if kind == "stage":
+            record_stage(*args)
+        elif kind == "coalesced":
+            record_coalesced(*args)
+
+
+async def to_thread(fn, *args, **kwargs):
+    """asyncio.to_thread that also profiles fn when the current request is being profiled."""
+    profiles = _request_profiles.get()
+    if profiles is None:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def profiled():
+        # One profiler per call, since several threads may work for the request at once
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profiles.append(profiler)
+
+    return await asyncio.to_thread(profiled)
+
+
+def record_failover(reason):
+    FAILOVERS_TOTAL.labels(reason).inc()
+
+
+def server_timing(spans, total):
+    """Formats collected spans as a Server-Timing header value (durations in ms)."""
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def metrics_payload():
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+async def timing_middleware(request, call_next):
+    """Collects spans for the request, records request metrics and sets Server-Timing."""
+    spans = []
+    token = _request_spans.set(spans)
+
+    profiles = None
+    profile_skipped = None
+    if request.headers.get("x-profile") == "1":
+        if not PROFILING_ENABLED:
+            profile_skipped = "profiling is disabled (PROFILING_ENABLED=0)"
+        elif _profile_lock.acquire(blocking=False):
+            profiles = []
+        else:
+            profile_skipped = "another request is being profiled"
+    profile_token = _request_profiles.set(profiles)
+
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        total = time.perf_counter() - started
+        _request_spans.reset(token)
+        _request_profiles.reset(profile_token)
+        if profiles is not None:
+            _profile_lock.release()
+
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        REQUEST_SECONDS.labels(request.method, endpoint).observe(total)
+        REQUESTS_TOTAL.labels(request.method, endpoint, str(status)).inc()
+
+    response.headers["Server-Timing"] = server_timing(spans, total)
+    if profiles:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_path = os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}{endpoint.replace('/', '_')}.prof")
+        pstats.Stats(*profiles).dump_stats(profile_path)
+        response.headers["X-Profile-File"] = profile_path
+    elif profiles is not None:
+        profile_skipped = "no work ran in worker threads"
+    if profile_skipped:
+        response.headers["X-Profile-Skipped"] = profile_skipped
+    return response
@@ -1,4 +1,7 @@
+import hashlib
 import os
+import re
+import tempfile
 import time
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
@@ -6,6 +9,32 @@ from selenium.webdriver.chrome.options import Options
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup
 
+from .metrics import span
+
+# Every scraped URL gets its own screenshot file, named by a hash of the URL, so concurrent
+# scrapes (and workers) never hand out another site's screenshot
+SCREENSHOT_DIR = os.getenv("SCREENSHOT_DIR", os.path.join(tempfile.gettempdir(), "multiscrapper-screenshots"))
+
+def screenshot_key(url):
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+def screenshot_path(key):
+    """Path of the screenshot stored under key, or None if the key is malformed."""
+    if not re.fullmatch(r"[0-9a-f]{32}", key or ""):
+        return None
+    return os.path.join(SCREENSHOT_DIR, f"{key}.png")
+
+def save_screenshot(url, png):
+    """Stores a PNG screenshot of url. Returns (key, path)."""
+    key = screenshot_key(url)
+    path = screenshot_path(key)
+    os.makedirs(SCREENSHOT_DIR, exist_ok=True)
+    # Write to a temporary file and rename, so readers never see a half-written image
+    with tempfile.NamedTemporaryFile(dir=SCREENSHOT_DIR, suffix=".tmp", delete=False) as f:
+        f.write(png)
+    os.replace(f.name, path)
+    return key, path
+
 def get_driver():
     chrome_options = Options()
     chrome_options.add_argument("--headless")
@@ -15,22 +44,24 @@ def get_driver():
     return webdriver.Chrome(service=service, options=chrome_options)
 
 def scrape_website(url):
+    """Loads url in headless Chrome. Returns (html, screenshot_key, screenshot_path)."""
     try:
-        driver = get_driver()
+        with span("driver_acquire"):
+            driver = get_driver()
     except Exception as e:
         print(f"Driver Error: {e}")
         raise Exception(f"Failed to start Chrome. Make sure Google Chrome is installed on your system. Error: {str(e)}")
     
     try:
-        driver.get(url)
-        time.sleep(3)
-        html = driver.page_source
+        with span("page_load"):
+            driver.get(url)
+            time.sleep(3)
+            html = driver.page_source
         
         # Take screenshot for vision
-        screenshot_path = "page.png"
-        driver.save_screenshot(screenshot_path)
+        key, path = save_screenshot(url, driver.get_screenshot_as_png())
         
-        return html, screenshot_path
+        return html, key, path
     finally:
         driver.quit()
 
@@ -0,0 +1,56 @@
+import asyncio
+
+from .metrics import INFLIGHT_CALLS, record_coalesced
+
+# Single-flight request coalescing. Concurrent callers asking for the same key share
+# one running call instead of each starting identical expensive work (Chrome sessions,
+# transcript fetches, index builds).
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        # key -> [task, number of callers still waiting]
+        self.inflight = {}
+
+    async def do(self, key, fn):
+        """
+        Runs fn() (which returns an awaitable) once per key at a time and returns its
+        result to every concurrent caller. Errors are raised to every caller and the
+        key is released, so the next call retries. A caller that is cancelled stops
+        waiting without cancelling the shared call, unless it was the last one waiting.
+        """
+        entry = self.inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            entry = [task, 0]
+            self.inflight[key] = entry
+            INFLIGHT_CALLS.labels(self.name).inc()
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            record_coalesced(self.name)
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                # Nobody else is waiting: stop the work and let new callers start fresh
+                task.cancel()
+                self._release(key, task)
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _release(self, key, task):
+        entry = self.inflight.get(key)
+        if entry is not None and entry[0] is task:
+            del self.inflight[key]
+            INFLIGHT_CALLS.labels(self.name).dec()
+
+    def _finish(self, key, task):
+        self._release(key, task)
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            task.exception()
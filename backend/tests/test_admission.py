@@ -0,0 +1,153 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from backend import admission
+from backend.admission import PRIORITIES, AdmissionLimiter
+
+
+def test_full_queue_returns_503_with_retry_after():
+    limiter = AdmissionLimiter("test_full", limit=0, queue_size=0)
+    app = FastAPI()
+
+    @app.get("/work", dependencies=[Depends(limiter.slot)])
+    async def work():
+        return {"ok": True}
+
+    response = TestClient(app).get("/work")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == str(admission.ADMISSION_RETRY_AFTER)
+
+
+def test_released_slot_goes_to_the_highest_priority_waiter():
+    async def scenario():
+        limiter = AdmissionLimiter("test_priority", limit=1, queue_size=4)
+        await limiter.acquire()
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(priority)
+            order.append(name)
+            limiter.release()
+
+        tasks = [
+            asyncio.create_task(request("low", PRIORITIES["low"])),
+            asyncio.create_task(request("normal", PRIORITIES["normal"])),
+            asyncio.create_task(request("high", PRIORITIES["high"])),
+        ]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return order, limiter
+
+    order, limiter = asyncio.run(scenario())
+    assert order == ["high", "normal", "low"]
+    assert limiter.active == 0
+    assert limiter.waiters == []
+
+
+def test_queue_timeout_returns_503(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT", 0.01)
+
+    async def scenario():
+        limiter = AdmissionLimiter("test_timeout", limit=1, queue_size=4)
+        await limiter.acquire()
+        with pytest.raises(HTTPException) as error:
+            await limiter.acquire()
+        return error.value, limiter
+
+    error, limiter = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert limiter.active == 1
+    assert limiter.waiters == []
+
+
+def test_timeout_during_handoff_passes_the_slot_on(monkeypatch):
+    limiter = AdmissionLimiter("test_handoff", limit=1, queue_size=4)
+
+    async def handoff_then_timeout(future, timeout):
+        # The holder hands its slot over in the same instant the wait times out
+        limiter.release()
+        raise asyncio.TimeoutError
+
+    async def scenario():
+        await limiter.acquire()
+        monkeypatch.setattr(admission.asyncio, "wait_for", handoff_then_timeout)
+        with pytest.raises(HTTPException):
+            await limiter.acquire()
+        monkeypatch.undo()
+
+    asyncio.run(scenario())
+    # The timed-out request gave the handed-over slot back, so nothing is held
+    assert limiter.active == 0
+    assert limiter.waiters == []
+
+
+def test_cancel_during_handoff_does_not_leak_the_slot():
+    async def scenario():
+        limiter = AdmissionLimiter("test_cancel", limit=1, queue_size=4)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # Hand the slot over and cancel the waiter before it wakes up
+        limiter.release()
+        waiter.cancel()
+        try:
+            await waiter
+            # Some Python versions let the handoff win; then the waiter owns the slot
+            limiter.release()
+        except asyncio.CancelledError:
+            pass
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.active == 0
+    assert limiter.waiters == []
+
+
+def test_limits_are_shared_between_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_LOCK_DIR", str(tmp_path))
+    monkeypatch.setattr(admission, "ADMISSION_QUEUE_TIMEOUT", 0.2)
+
+    async def scenario():
+        # Two limiters with one lock directory stand in for two worker processes
+        first = AdmissionLimiter("test_shared", limit=1, queue_size=4, shared=True)
+        second = AdmissionLimiter("test_shared", limit=1, queue_size=4, shared=True)
+        await first.acquire()
+        with pytest.raises(HTTPException) as error:
+            await second.acquire()
+        # The worker gave its own slot back after failing to get a shared one
+        assert second.active == 0
+
+        waiter = asyncio.create_task(second.acquire())
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        first.release()
+        await waiter
+        second.release()
+        return error.value, first, second
+
+    error, first, second = asyncio.run(scenario())
+    assert error.status_code == 503
+    assert first.active == second.active == 0
+    assert first.shared_handles == second.shared_handles == []
+
+
+def test_high_priority_needs_the_key(monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_PRIORITY_KEY", "secret")
+
+    def priority(headers):
+        return admission.request_priority(SimpleNamespace(headers=headers))
+
+    assert priority({"x-priority": "high"}) == PRIORITIES["normal"]
+    assert priority({"x-priority": "high", "x-priority-key": "wrong"}) == PRIORITIES["normal"]
+    assert priority({"x-priority": "high", "x-priority-key": "secret"}) == PRIORITIES["high"]
+    assert priority({"x-priority": "low"}) == PRIORITIES["low"]
+    assert priority({}) == PRIORITIES["normal"]
+
+    monkeypatch.setattr(admission, "ADMISSION_PRIORITY_KEY", None)
+    assert priority({"x-priority": "high", "x-priority-key": ""}) == PRIORITIES["normal"]
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+from backend import context
+from backend.context import chunk_offsets, count_tokens, pack_context, token_budget
+
+
+def llm(name="llama3-8b-8192"):
+    return SimpleNamespace(model_name=name)
+
+
+def test_token_budget_is_capped_by_the_model_window():
+    available = int((8_192 - context.RESPONSE_RESERVE) * context.WINDOW_SAFETY_MARGIN)
+
+    assert token_budget("llama3-8b-8192", 100_000) == available
+    assert token_budget("llama3-8b-8192", 1_000) == 1_000
+    assert token_budget("llama3-8b-8192") == available
+    # Unknown models get the conservative default window
+    assert token_budget("some-new-model") == int(
+        (context.DEFAULT_CONTEXT_WINDOW - context.RESPONSE_RESERVE) * context.WINDOW_SAFETY_MARGIN
+    )
+
+
+def test_pack_context_takes_the_best_spans_that_fit():
+    sections = [f"Section {i}: " + "filler text " * 20 for i in range(4)]
+    text = "\n".join(sections)
+    offsets = chunk_offsets(text, sections)
+    scores = [0.1, 0.9, 0.5, 0.2]
+    budget = count_tokens(sections[1]) + count_tokens(sections[2])
+
+    packed, tokens = pack_context(text, [(s, e, score) for (s, e), score in zip(offsets, scores)], llm(), budget)
+
+    assert "Section 1" in packed and "Section 2" in packed
+    assert "Section 0" not in packed and "Section 3" not in packed
+    assert tokens <= budget
+
+
+def test_pack_context_sends_overlapping_text_once():
+    text = "alpha beta gamma delta epsilon zeta eta theta"
+    first = (0, text.index("delta") + len("delta"))
+    second = (text.index("gamma"), len(text))
+
+    packed, _ = pack_context(text, [(*first, 1.0), (*second, 0.5)], llm(), 1_000)
+
+    assert packed == text
+
+
+def test_pack_context_skips_spans_inside_a_better_one():
+    text = "one two three four five six"
+    packed, _ = pack_context(text, [(0, len(text), 1.0), (4, 13, 0.5)], llm(), 1_000)
+    assert packed == text
+
+
+def test_chunk_offsets_follow_repeated_chunks():
+    text = "repeat me. other. repeat me."
+    assert chunk_offsets(text, ["repeat me.", "other.", "repeat me."]) == [(0, 10), (11, 17), (18, 28)]
+
+
+def test_chunk_offsets_fail_loudly_for_a_missing_chunk():
+    with pytest.raises(ValueError):
+        chunk_offsets("some source text", ["some", "not in the text"])
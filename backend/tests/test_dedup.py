@@ -0,0 +1,87 @@
+import random
+import re
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from backend.dedup import dedup_chunks
+from backend.scraper import clean_body_content
+
+
+def split(text):
+    return RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200).split_text(text)
+
+
+def catalog_html(cards):
+    boilerplate = "<nav>Home | Shop | About | Contact</nav><div>We use cookies. Accept?</div>"
+    return f"<html><body>{boilerplate}{''.join(cards)}{boilerplate}<footer>Footer</footer></body></html>"
+
+
+def assert_all_survive(chunks, kept, values):
+    indexed = "\n".join(kept)
+    missing = [value for value in values if not re.search(rf"\b{re.escape(value)}\b", indexed)]
+    assert not missing, f"{len(missing)} values lost by dedup, e.g. {missing[:5]}"
+
+
+def test_templated_catalog_keeps_every_product():
+    cards = [
+        f"<div class='card'><h2>Product {i}</h2><p>Price: ${i % 90 + 9}.99</p>"
+        f"<p>Features: fast, light, model {i}</p></div>"
+        for i in range(400)
+    ]
+    chunks = split(clean_body_content(catalog_html(cards)))
+    kept, canonical, stats = dedup_chunks(chunks)
+
+    assert_all_survive(chunks, kept, [f"Product {i}" for i in range(400)])
+    assert len(canonical) == len(chunks)
+    assert stats["kept_chunks"] == len(kept)
+
+
+def test_varied_listings_keep_every_sku():
+    rng = random.Random(7)
+    brands = ["Acme", "Globex", "Initech", "Umbrella", "Hooli", "Stark"]
+    skus = [f"SKU{rng.randint(100000, 999999)}" for _ in range(300)]
+    cards = [
+        f"<div class='card'><h2>{rng.choice(brands)} Widget</h2><p>Price: ${rng.randint(5, 500)}.99</p>"
+        f"<p>Rating: {rng.randint(1, 5)} stars</p><p>{sku}</p></div>"
+        for sku in skus
+    ]
+    chunks = split(clean_body_content(catalog_html(cards)))
+    kept, _, _ = dedup_chunks(chunks)
+
+    assert_all_survive(chunks, kept, skus)
+
+
+def test_repeated_boilerplate_is_dropped_and_mapped():
+    banner = "We use cookies to improve your experience. Accept all cookies to continue browsing our store."
+    chunks = [banner, "Laptop X1 costs $999 and has 16GB RAM.", banner, banner.upper(), banner + " "]
+    kept, canonical, stats = dedup_chunks(chunks)
+
+    assert kept == [banner, "Laptop X1 costs $999 and has 16GB RAM."]
+    assert canonical == [0, 1, 0, 0, 0]
+    assert stats["exact_duplicates"] == 3
+    assert stats["dedup_ratio"] == 0.6
+
+
+def test_near_duplicate_is_dropped_only_when_covered():
+    base = " ".join(f"word{i}" for i in range(120))
+    repeated_word = "word0 " + base
+    with_new_value = "SKU123456 " + base
+
+    kept, canonical, stats = dedup_chunks([base, repeated_word, with_new_value])
+
+    assert canonical[1] == 0
+    assert with_new_value in kept
+    assert stats["near_duplicates"] == 1
+
+
+def test_larger_max_distance_still_finds_candidates():
+    # These fingerprints differ in 4 bits, so they only match with a wider distance
+    base = " ".join(f"word{i}" for i in range(120))
+    variant = base + " word5"
+
+    kept, _, _ = dedup_chunks([base, variant])
+    assert len(kept) == 2
+
+    kept, canonical, _ = dedup_chunks([base, variant], max_distance=8)
+    assert kept == [base]
+    assert canonical == [0, 0]
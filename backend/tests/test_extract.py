@@ -0,0 +1,86 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from backend import extract
+from backend.extract import extract_rows, merge_rows, parse_rows, rows_to_markdown
+
+
+def test_parse_rows_reads_code_fenced_json():
+    content = '```json\n[{"name": "Acme Widget", "price": "$19.99"}]\n```'
+    assert parse_rows(content) == [{"name": "Acme Widget", "price": "$19.99"}]
+
+
+def test_parse_rows_ignores_chatter_and_non_objects():
+    content = 'Sure! Here are the items:\n[{"name": "A"}, "stray", {"name": "B"}]\nLet me know if you need more.'
+    assert parse_rows(content) == [{"name": "A"}, {"name": "B"}]
+
+
+def test_parse_rows_returns_nothing_for_invalid_json():
+    assert parse_rows("[not json]") == []
+    assert parse_rows("No products found.") == []
+
+
+def test_partial_row_at_window_edge_joins_its_complete_copy():
+    merged = merge_rows([{"name": "Acme Widget"}, {"name": "acme  widget", "price": "$19.99"}])
+    assert merged == [{"name": "Acme Widget", "price": "$19.99"}]
+
+    merged = merge_rows([{"name": "Acme Widget", "price": "$19.99"}, {"name": "Acme Widget", "features": "light"}])
+    assert merged == [{"name": "Acme Widget", "price": "$19.99", "features": "light"}]
+
+
+def test_same_name_with_different_prices_stays_separate():
+    rows = [
+        {"name": "Acme Widget", "price": "$19.99"},
+        {"name": "Acme Widget", "price": "$29.99"},
+        {"name": "Acme Widget"},
+    ]
+    merged = merge_rows(rows)
+    assert [row["price"] for row in merged] == ["$19.99", "$29.99"]
+
+
+def test_rows_without_name_merge_on_all_values():
+    rows = [{"sku": "A1", "stock": "3"}, {"sku": "a1 ", "stock": "3"}, {"sku": "B2", "stock": "3"}]
+    assert merge_rows(rows) == [{"sku": "A1", "stock": "3"}, {"sku": "B2", "stock": "3"}]
+
+
+def test_markdown_escapes_pipes_and_newlines():
+    table = rows_to_markdown([{"name": "A | B", "features": ["fast", "light"], "note": "two\nlines"}])
+    assert table.splitlines() == [
+        "| name | features | note |",
+        "| --- | --- | --- |",
+        "| A \\| B | fast, light | two lines |",
+    ]
+    assert rows_to_markdown([]) == "No structured data found."
+
+
+class WindowLLM:
+    model_name = "gemini-2.0-flash"
+
+    def __init__(self, failing):
+        self.failing = failing
+
+    async def ainvoke(self, prompt):
+        for marker in self.failing:
+            if marker in prompt:
+                raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        item = prompt.rsplit("Text:\n", 1)[1].strip()
+        return SimpleNamespace(content=f'[{{"name": "{item}"}}]')
+
+
+def test_failed_window_keeps_the_other_rows(monkeypatch):
+    monkeypatch.setattr(extract, "split_windows", lambda text, llm: ["first", "second", "third"])
+
+    rows, stats = asyncio.run(extract_rows("page", WindowLLM(failing=["second"])))
+
+    assert rows == [{"name": "first"}, {"name": "third"}]
+    assert stats["failed_windows"] == 1
+    assert stats["windows"] == 3
+
+
+def test_every_window_failing_raises(monkeypatch):
+    monkeypatch.setattr(extract, "split_windows", lambda text, llm: ["first", "second"])
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(extract_rows("page", WindowLLM(failing=["first", "second"])))
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+from multiprocessing import AuthenticationError
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from prometheus_client import REGISTRY
+
+from backend import index_service, metrics
+from backend.index_service import LocalIndex, RemoteIndex
+
+
+def build(index, text_hash):
+    chunks = [f"{text_hash} chunk {i}" for i in range(3)]
+    metadatas = [{"start": i, "end": i + 1, "duplicates": []} for i in range(3)]
+    index.build(text_hash, chunks, metadatas, {"kept_chunks": 3})
+
+
+def test_search_after_eviction_reports_a_miss(monkeypatch):
+    monkeypatch.setattr(index_service, "INDEX_CACHE_SIZE", 1)
+    index = LocalIndex(DeterministicFakeEmbedding(size=16))
+    build(index, "first")
+    assert index.info("first") == {"kept_chunks": 3}
+
+    # Another document evicts "first" between info() and search()
+    build(index, "second")
+
+    assert index.search("first", "chunk", 2) is None
+    assert len(index.search("second", "chunk", 2)) == 2
+
+
+def test_build_and_search_survives_a_full_cache(monkeypatch):
+    monkeypatch.setattr(index_service, "INDEX_CACHE_SIZE", 1)
+    index = LocalIndex(DeterministicFakeEmbedding(size=16))
+    build(index, "other")
+
+    chunks = ["a chunk", "b chunk"]
+    metadatas = [{"start": 0, "end": 7, "duplicates": []}, {"start": 8, "end": 15, "duplicates": []}]
+    results = index.build_and_search("doc", chunks, metadatas, {}, "chunk", 2)
+
+    assert sorted(metadata["start"] for metadata, _ in results) == [0, 8]
+    assert index.info("other") is None
+
+
+class SlowEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        time.sleep(0.2)
+        return super().embed_documents(texts)
+
+
+def test_concurrent_builds_of_one_document_embed_once():
+    index = LocalIndex(SlowEmbeddings(size=16))
+    threads = [threading.Thread(target=build, args=(index, "doc")) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert index.embeddings.calls == 1
+    assert index.info("doc") == {"kept_chunks": 3}
+    assert index.building == {}
+
+
+def serve_in_thread(index, socket_path, authkey):
+    listener = index_service.listen(socket_path, authkey)
+
+    def accept():
+        try:
+            index_service._handle(listener.accept(), index)
+        except Exception:
+            pass
+
+    threading.Thread(target=accept, daemon=True).start()
+    return listener
+
+
+def test_socket_is_owner_only_and_requires_the_key(tmp_path):
+    socket_path = str(tmp_path / "index.sock")
+    listener = serve_in_thread(LocalIndex(DeterministicFakeEmbedding(size=16)), socket_path, b"secret")
+
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    with pytest.raises(AuthenticationError):
+        RemoteIndex(socket_path, authkey=b"wrong").get_value("key")
+    listener.close()
+
+
+def test_remote_index_needs_an_authkey(monkeypatch):
+    monkeypatch.delenv("INDEX_SERVICE_AUTHKEY", raising=False)
+    with pytest.raises(RuntimeError):
+        RemoteIndex("/tmp/unused.sock")
+
+
+def test_remote_build_reports_service_stages_to_the_worker(tmp_path):
+    socket_path = str(tmp_path / "index.sock")
+    listener = serve_in_thread(LocalIndex(DeterministicFakeEmbedding(size=16)), socket_path, b"secret")
+    spans = []
+    token = metrics._request_spans.set(spans)
+    try:
+        build(RemoteIndex(socket_path, authkey=b"secret"), "doc")
+    finally:
+        metrics._request_spans.reset(token)
+        listener.close()
+
+    stages = [stage for stage, _ in spans]
+    assert "embed" in stages and "index_build" in stages and "index_service" in stages
+
+
+def test_coalesced_builds_are_forwarded_to_the_workers():
+    index = LocalIndex(SlowEmbeddings(size=16))
+    forwarded = []
+
+    def worker_call():
+        # Each service thread collects what it observed for the worker it serves
+        with metrics.forward_observations() as observations:
+            build(index, "doc")
+        forwarded.extend(observations)
+
+    threads = [threading.Thread(target=worker_call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert forwarded.count(("coalesced", "index_service_build")) == 3
+    assert [stage for kind, stage, *_ in forwarded if kind == "stage"].count("embed") == 1
+
+
+def test_replayed_coalesced_builds_reach_the_worker_counter():
+    sample = ("multiscrapper_coalesced_requests_total", {"flight": "index_service_build"})
+
+    def count():
+        return REGISTRY.get_sample_value(*sample) or 0.0
+
+    before = count()
+    metrics.replay_observations([("coalesced", "index_service_build")])
+    assert count() == before + 1
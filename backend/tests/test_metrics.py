@@ -0,0 +1,50 @@
+import pstats
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend import metrics
+from backend.metrics import span, timing_middleware, to_thread
+
+
+def blocking_work():
+    with span("work"):
+        return sum(i * i for i in range(10_000))
+
+
+def make_client():
+    app = FastAPI()
+    app.middleware("http")(timing_middleware)
+
+    @app.get("/work")
+    async def work():
+        return {"total": await to_thread(blocking_work)}
+
+    return TestClient(app)
+
+
+def test_server_timing_includes_thread_spans():
+    response = make_client().get("/work")
+    assert "work;dur=" in response.headers["server-timing"]
+
+
+def test_profile_covers_the_worker_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path))
+
+    response = make_client().get("/work", headers={"X-Profile": "1"})
+
+    functions = {name for _, _, name in pstats.Stats(response.headers["x-profile-file"]).stats}
+    assert "blocking_work" in functions
+
+
+def test_profile_is_reported_as_skipped_when_busy(monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+    assert metrics._profile_lock.acquire(blocking=False)
+    try:
+        response = make_client().get("/work", headers={"X-Profile": "1"})
+    finally:
+        metrics._profile_lock.release()
+
+    assert "x-profile-file" not in response.headers
+    assert response.headers["x-profile-skipped"] == "another request is being profiled"
@@ -0,0 +1,26 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from backend import scraper
+
+
+def test_each_url_gets_its_own_screenshot(tmp_path, monkeypatch):
+    monkeypatch.setattr(scraper, "SCREENSHOT_DIR", str(tmp_path))
+    urls = [f"https://shop.example/page/{i}" for i in range(8)]
+
+    # Concurrent scrapes of different sites must not overwrite each other's screenshot
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        saved = list(pool.map(lambda url: scraper.save_screenshot(url, url.encode()), urls))
+
+    for url, (key, path) in zip(urls, saved):
+        assert scraper.screenshot_path(key) == path
+        with open(path, "rb") as f:
+            assert f.read() == url.encode()
+    assert len({key for key, _ in saved}) == len(urls)
+    assert not [name for name in tmp_path.iterdir() if name.suffix == ".tmp"]
+
+
+def test_screenshot_path_rejects_malformed_keys():
+    assert scraper.screenshot_path("../../etc/passwd") is None
+    assert scraper.screenshot_path("") is None
+    assert scraper.screenshot_path(None) is None
+    assert scraper.screenshot_path("0" * 32).endswith("0" * 32 + ".png")
@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+from backend.singleflight import SingleFlight
+
+
+class Work:
+    """Counts calls and blocks until released, so tests control when the call finishes."""
+
+    def __init__(self, result="done", error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.cancelled = False
+
+    async def __call__(self):
+        self.calls += 1
+        self.started.set()
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_callers_share_one_result():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work(result={"rows": 3})
+        callers = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+        await work.started.wait()
+        work.release.set()
+        results = await asyncio.gather(*callers)
+        return work, results, flight
+
+    work, results, flight = asyncio.run(scenario())
+    assert work.calls == 1
+    assert all(result is results[0] for result in results)
+    assert flight.inflight == {}
+
+
+def test_error_is_shared_and_next_call_retries():
+    async def scenario():
+        flight = SingleFlight("test")
+        failing = Work(error=RuntimeError("Chrome crashed"))
+        callers = [asyncio.create_task(flight.do("key", failing)) for _ in range(3)]
+        await failing.started.wait()
+        failing.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+
+        retry = Work(result="ok")
+        retry.release.set()
+        return failing, outcomes, await flight.do("key", retry), retry
+
+    failing, outcomes, retried, retry = asyncio.run(scenario())
+    assert failing.calls == 1
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert retried == "ok"
+    assert retry.calls == 1
+
+
+def test_cancelling_one_waiter_keeps_the_shared_call():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await work.started.wait()
+        first.cancel()
+        await asyncio.sleep(0)
+        work.release.set()
+        return work, await second, first
+
+    work, result, first = asyncio.run(scenario())
+    assert result == "done"
+    assert first.cancelled()
+    assert not work.cancelled
+
+
+def test_cancelling_the_last_waiter_cancels_the_call():
+    async def scenario():
+        flight = SingleFlight("test")
+        work = Work()
+        caller = asyncio.create_task(flight.do("key", work))
+        await work.started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        assert flight.inflight == {}
+
+        # A new caller starts fresh instead of joining the cancelled call
+        fresh = Work(result="fresh")
+        fresh.release.set()
+        return work, await flight.do("key", fresh)
+
+    work, result = asyncio.run(scenario())
+    assert work.cancelled
+    assert result == "fresh"
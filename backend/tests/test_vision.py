@@ -0,0 +1,73 @@
+from PIL import Image, ImageDraw
+
+from backend import vision
+
+
+class CountingModel:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, parts):
+        self.calls += 1
+        self.parts = parts
+
+        class Response:
+            text = f"analysis {self.calls}"
+
+        return Response()
+
+
+def product_page(path, price):
+    # Same layout every time, only the price text differs
+    img = Image.new("RGB", (800, 600), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((40, 40, 760, 120), fill="navy")
+    draw.rectangle((40, 160, 360, 480), fill="lightgray")
+    draw.text((400, 200), "Acme Widget", fill="black")
+    draw.text((400, 240), f"Price: ${price}", fill="black")
+    img.save(path)
+    return str(path)
+
+
+def test_same_layout_different_prices_are_not_shared(tmp_path):
+    vision.vision_cache.clear()
+    model = CountingModel()
+    cheap = product_page(tmp_path / "cheap.png", "19.99")
+    pricey = product_page(tmp_path / "pricey.png", "99.99")
+
+    first, stats = vision.analyze_image(model, "m", cheap, "List prices")
+    second, _ = vision.analyze_image(model, "m", pricey, "List prices")
+
+    assert model.calls == 2
+    assert first != second
+    assert stats["cached"] is False
+
+
+def test_identical_screenshot_is_cached(tmp_path):
+    vision.vision_cache.clear()
+    model = CountingModel()
+    page = product_page(tmp_path / "page.png", "19.99")
+    copy = product_page(tmp_path / "copy.png", "19.99")
+
+    first, _ = vision.analyze_image(model, "m", page, "List prices")
+    second, stats = vision.analyze_image(model, "m", copy, "List prices")
+
+    assert model.calls == 1
+    assert second == first
+    assert stats["cached"] is True
+
+
+def test_tiles_past_the_limit_are_reported(tmp_path, monkeypatch):
+    vision.vision_cache.clear()
+    monkeypatch.setattr(vision, "VISION_MAX_TILES", 2)
+    model = CountingModel()
+    tall = tmp_path / "tall.png"
+    # 400px wide at aspect 1.5 gives 600px tiles, so 3000px is five tiles
+    Image.new("RGB", (400, 3000), "white").save(tall)
+
+    _, stats = vision.analyze_image(model, "m", str(tall), "Describe")
+
+    assert stats["tiles"] == 2
+    assert stats["dropped_tiles"] == 3
+    assert "cut off" in model.parts[0]
+    assert len(model.parts) == 3
@@ -0,0 +1,117 @@
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image
+
+from .metrics import to_thread
+
+# Vision preprocessing. Screenshots are downscaled (and tiled when very tall),
+# re-encoded as compact JPEGs, and analyses are cached by (file digest, model, prompt).
+
+VISION_MAX_WIDTH = int(os.getenv("VISION_MAX_WIDTH", 1280))
+# Tiles taller than width * VISION_TILE_ASPECT are split into several tiles
+VISION_TILE_ASPECT = float(os.getenv("VISION_TILE_ASPECT", 1.5))
+VISION_MAX_TILES = int(os.getenv("VISION_MAX_TILES", 4))
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", 80))
+VISION_CACHE_SIZE = int(os.getenv("VISION_CACHE_SIZE", 128))
+
+# (content digest, model, prompt) -> analysis text, least recently used evicted first
+vision_cache = OrderedDict()
+# Analyses run in worker threads, so cache access is guarded
+vision_cache_lock = threading.Lock()
+
+
+def image_digest(data):
+    """
+    SHA-256 of the screenshot file bytes. A perceptual hash would map pages with the
+    same layout but different prices or names to one key, so only identical files match.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def load_image(data):
+    """Decodes screenshot bytes as RGB."""
+    with Image.open(io.BytesIO(data)) as img:
+        return img.convert("RGB")
+
+
+def encode_tiles(img):
+    """
+    Downscales to VISION_MAX_WIDTH and splits very tall pages into tiles.
+    Returns (parts, dropped): JPEG parts ready for generate_content and the number of
+    tiles past VISION_MAX_TILES that were left out.
+    """
+    if img.width > VISION_MAX_WIDTH:
+        height = round(img.height * VISION_MAX_WIDTH / img.width)
+        img = img.resize((VISION_MAX_WIDTH, height), Image.LANCZOS)
+
+    tile_height = max(1, int(img.width * VISION_TILE_ASPECT))
+    tops = range(0, img.height, tile_height)
+    dropped = max(0, len(tops) - VISION_MAX_TILES)
+    tiles = [
+        img.crop((0, top, img.width, min(top + tile_height, img.height)))
+        for top in tops[:VISION_MAX_TILES]
+    ]
+
+    parts = []
+    for tile in tiles:
+        buffer = io.BytesIO()
+        tile.save(buffer, format="JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        parts.append({"mime_type": "image/jpeg", "data": buffer.getvalue()})
+    return parts, dropped
+
+
+def cached_analysis(image_hash, model_name, prompt):
+    key = (image_hash, model_name, prompt)
+    with vision_cache_lock:
+        if key in vision_cache:
+            vision_cache.move_to_end(key)
+            return vision_cache[key]
+    return None
+
+
+def store_analysis(image_hash, model_name, prompt, text):
+    key = (image_hash, model_name, prompt)
+    with vision_cache_lock:
+        vision_cache[key] = text
+        vision_cache.move_to_end(key)
+        while len(vision_cache) > VISION_CACHE_SIZE:
+            vision_cache.popitem(last=False)
+
+
+def analyze_image(model, model_name, image_path, prompt):
+    """Blocking analysis with preprocessing and caching. Returns (text, stats)."""
+    started = time.perf_counter()
+    with open(image_path, "rb") as f:
+        data = f.read()
+    stats = {"original_bytes": len(data)}
+
+    # A cached analysis is answered without decoding the image
+    image_hash = image_digest(data)
+    cached = cached_analysis(image_hash, model_name, prompt)
+    if cached is not None:
+        return cached, {**stats, "cached": True, "seconds": round(time.perf_counter() - started, 3)}
+
+    parts, dropped = encode_tiles(load_image(data))
+    stats["sent_bytes"] = sum(len(p["data"]) for p in parts)
+    stats["tiles"] = len(parts)
+    stats["dropped_tiles"] = dropped
+
+    prompt_text = prompt
+    if len(parts) > 1:
+        prompt_text += f"\n\n(The page screenshot is split into {len(parts)} tiles, top to bottom.)"
+    if dropped:
+        # Say so, or the model describes a truncated page as if it were complete
+        prompt_text += f"\n\n(The page is cut off: the bottom {dropped} tile(s) of the screenshot were not sent.)"
+    response = model.generate_content([prompt_text, *parts])
+    store_analysis(image_hash, model_name, prompt, response.text)
+    return response.text, {**stats, "cached": False, "seconds": round(time.perf_counter() - started, 3)}
+
+
+async def analyze_image_async(model, model_name, image_path, prompt):
+    """Same as analyze_image but keeps PIL work and the Gemini call off the event loop."""
+    return await to_thread(analyze_image, model, model_name, image_path, prompt)
@@ -331,7 +331,7 @@ export default function ScrapperApp() {
                   <p className="text-[10px] text-gray-500 uppercase font-black mb-2 flex items-center gap-2">
                     <Activity size={10} /> Visual Grounding
                   </p>
-                  <img src={`${API_BASE_URL}/api/web/screenshot?t=${Date.now()}`} alt="Screenshot" className="rounded-lg border border-white/10 w-full hover:scale-[1.02] transition-transform cursor-zoom-in" />
+                  <img src={`${API_BASE_URL}/api/web/screenshot?key=${result.screenshot_key}&t=${Date.now()}`} alt="Screenshot" className="rounded-lg border border-white/10 w-full hover:scale-[1.02] transition-transform cursor-zoom-in" />
                 </div>
               )}
             </div>
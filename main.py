@@ -8,7 +8,7 @@ from dotenv import load_dotenv
 
 # Import our custom modules
 from scrape import scrape_website, clean_body_content
-from parse import get_rag_chain, parse_with_vision, extract_structured_data
+from parse import get_rag_chain, parse_with_vision, extract_structured_data, content_hash
 
 # Load environment variables
 load_dotenv()
@@ -20,6 +20,30 @@ if not GOOGLE_API_KEY:
 
 genai.configure(api_key=GOOGLE_API_KEY)
 
+# ================= CACHED LOADERS =================
+# Widget changes rerun the script; these keep PDFs and transcripts from being re-read each time.
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_pdf_text(file_hash, _file_bytes):
+    """Returns (text, page_count). _file_bytes is left out of the cache key, file_hash identifies it."""
+    import io
+    reader = PdfReader(io.BytesIO(_file_bytes))
+    text = "".join([page.extract_text() for page in reader.pages])
+    return text, len(reader.pages)
+
+@st.cache_data(max_entries=64, ttl=3600, show_spinner=False)
+def load_transcript(video_id):
+    ytt_api = YouTubeTranscriptApi()
+    transcript_list = ytt_api.list(video_id)
+    
+    try:
+        transcript = transcript_list.find_transcript(['en'])
+    except:
+        transcript = next(iter(transcript_list))
+        
+    data = transcript.fetch()
+    return " ".join([i.text for i in data])
+
 # ================= PAGE CONFIG & STYLING =================
 st.set_page_config(
     page_title="MultiScrapper AI Pro",
@@ -121,16 +145,7 @@ elif tool_choice == "🎥 YouTube Pro":
             if st.button("Summarize & Analyze"):
                 with st.spinner("🧠 Extracting insights..."):
                     try:
-                        ytt_api = YouTubeTranscriptApi()
-                        transcript_list = ytt_api.list(video_id)
-                        
-                        try:
-                            transcript = transcript_list.find_transcript(['en'])
-                        except:
-                            transcript = next(iter(transcript_list))
-                            
-                        data = transcript.fetch()
-                        text = " ".join([i.text for i in data])
+                        text = load_transcript(video_id)
                         
                         # Use the new resilient library
                         from parse import get_llm
@@ -158,9 +173,9 @@ elif tool_choice == "📄 PDF Intelligence":
     
     if uploaded_file:
         with st.spinner("📂 Reading PDF..."):
-            reader = PdfReader(uploaded_file)
-            text = "".join([page.extract_text() for page in reader.pages])
-            st.success(f"Loaded {len(reader.pages)} pages")
+            file_bytes = uploaded_file.getvalue()
+            text, page_count = load_pdf_text(content_hash(file_bytes), file_bytes)
+            st.success(f"Loaded {page_count} pages")
         
         # Reset RAG if model or file changes
         if st.button("Initialize/Reset AI Engine"):
@@ -191,6 +206,8 @@ elif tool_choice == "🌐 Web AI Agent":
     col1, col2 = st.columns(2)
     with col1:
         mode = st.radio("Analysis Mode", ["Smart Q&A (RAG)", "Data Table Extraction", "Visual Analysis (Vision)"])
+    with col2:
+        full_page = st.checkbox("Scan full page (table extraction)", value=True)
     
     if st.button("Start Processing"):
         with st.spinner("🕸️ Navigating & Scraping..."):
@@ -203,7 +220,7 @@ elif tool_choice == "🌐 Web AI Agent":
             
             elif mode == "Data Table Extraction":
                 st.info("Extracting structured fields...")
-                table_data = extract_structured_data(text_cleaned, "product names, prices, and features", provider=ai_provider)
+                table_data = extract_structured_data(text_cleaned, "product names, prices, and features", provider=ai_provider, full_page=full_page)
                 st.markdown(table_data)
             
             elif mode == "Visual Analysis (Vision)":
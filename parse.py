@@ -1,5 +1,7 @@
 import os
 import time
+import asyncio
+import hashlib
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_groq import ChatGroq
 from langchain_community.vectorstores import FAISS
@@ -18,6 +20,22 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Streamlit reruns the whole script on every widget change, so heavy objects are
+# cached as process-wide resources instead of being rebuilt each time.
+
+@st.cache_resource
+def get_embeddings():
+    """Local Embeddings (Free & Unlimited), loaded once per process."""
+    return HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+
+@st.cache_resource
+def _groq_client(model_name, groq_key):
+    return ChatGroq(model_name=model_name, groq_api_key=groq_key)
+
+@st.cache_resource
+def _gemini_client(model_name):
+    return ChatGoogleGenerativeAI(model=model_name, temperature=0.3, max_retries=3)
+
 def get_llm(provider="Gemini (Flash 2.0)"):
     """
     Returns the requested LLM instance with basic error handling.
@@ -28,24 +46,34 @@ def get_llm(provider="Gemini (Flash 2.0)"):
             st.warning("GROQ_API_KEY not found in .env. Falling back to Gemini.")
             provider = "Gemini (Flash 2.0)"
         else:
-            return ChatGroq(model_name="llama3-8b-8192", groq_api_key=groq_key)
+            return _groq_client("llama3-8b-8192", groq_key)
 
     if provider == "Gemini (Flash 1.5)":
-        return ChatGoogleGenerativeAI(model="gemini-1.5-flash", temperature=0.3, max_retries=3)
+        return _gemini_client("gemini-1.5-flash")
     
     # Default: Gemini 2.0 Flash
-    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.3, max_retries=3)
+    return _gemini_client("gemini-2.0-flash")
+
+def content_hash(data):
+    """Stable hash used as the cache key for documents, so big texts aren't re-hashed by Streamlit."""
+    if isinstance(data, str):
+        data = data.encode()
+    return hashlib.sha256(data).hexdigest()
 
 def get_rag_chain(text_content, provider="Gemini (Flash 2.0)"):
     """
     Creates a RAG chain with customizable LLM providers for resilience.
+    Chains are cached per (document, provider).
     """
+    return _build_rag_chain(content_hash(text_content), provider, text_content)
+
+@st.cache_resource(max_entries=8)
+def _build_rag_chain(text_hash, provider, _text_content):
+    # _text_content is excluded from Streamlit's cache key; text_hash identifies it
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_text(text_content)
+    chunks = text_splitter.split_text(_text_content)
 
-    # Local Embeddings (Free & Unlimited)
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vector_store = FAISS.from_texts(chunks, embeddings)
+    vector_store = FAISS.from_texts(chunks, get_embeddings())
 
     # Select LLM based on user preference or quota
     llm = get_llm(provider)
@@ -69,24 +97,36 @@ def get_rag_chain(text_content, provider="Gemini (Flash 2.0)"):
 def parse_with_vision(image_path, user_prompt):
     """Fallback logic for Vision if 2.0 fails."""
     import google.generativeai as genai
-    from PIL import Image
+    from backend.vision import analyze_image
     
     # Try 2.0 first, then 1.5
     for model_name in ['gemini-2.0-flash', 'gemini-1.5-flash']:
         try:
             model = genai.GenerativeModel(model_name)
-            img = Image.open(image_path)
-            response = model.generate_content([user_prompt, img])
-            return response.text
+            # Downscaled, re-encoded and cached by file digest + prompt
+            analysis, _ = analyze_image(model, model_name, image_path, user_prompt)
+            return analysis
         except Exception as e:
             if "429" in str(e):
                 continue
             return f"Vision Error: {e}"
     return "Quota exhausted for all Vision models."
 
-def extract_structured_data(text_content, schema_description, provider="Gemini (Flash 2.0)"):
-    """Extracts tables with fallback provider support."""
+def extract_structured_data(text_content, schema_description, provider="Gemini (Flash 2.0)", full_page=False):
+    """Extracts tables with fallback provider support. full_page scans every window of the text concurrently."""
     llm = get_llm(provider)
+
+    if full_page:
+        from backend.extract import extract_rows, rows_to_markdown
+        try:
+            rows, stats = asyncio.run(extract_rows(text_content, llm, schema=schema_description))
+            table = rows_to_markdown(rows)
+            if stats["failed_windows"]:
+                table += f"\n\n*{stats['failed_windows']} of {stats['windows']} page sections failed to extract, so this table may be incomplete.*"
+            return table
+        except Exception as e:
+            return f"Extraction Error: {e}. Try switching the AI Provider in the sidebar."
+
     prompt = f"Extract the following as a markdown table: {schema_description}\n\nText: {text_content[:8000]}"
     
     try:
@@ -1,4 +1,31 @@
 #!/bin/bash
 # Render startup script
 export PORT=${PORT:-10000}
-uvicorn backend.main:app --host 0.0.0.0 --port $PORT
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+
+if [ "$WEB_CONCURRENCY" -gt 1 ]; then
+    # Multi-worker mode: one index service holds the embedding model and vector
+    # indexes, and every uvicorn worker talks to it over a Unix socket.
+    export INDEX_SERVICE_SOCKET=${INDEX_SERVICE_SOCKET:-/tmp/multiscrapper-index.sock}
+    # Requests to the index service are pickled, so only holders of this key may connect
+    export INDEX_SERVICE_AUTHKEY=${INDEX_SERVICE_AUTHKEY:-$(head -c32 /dev/urandom | base64)}
+    # Admission limits hold for the whole instance; the workers share slots through lock files here
+    export ADMISSION_LOCK_DIR=${ADMISSION_LOCK_DIR:-$(mktemp -d /tmp/multiscrapper-admission.XXXXXX)}
+    rm -f "$INDEX_SERVICE_SOCKET"
+    python -m backend.index_service --socket "$INDEX_SERVICE_SOCKET" &
+    INDEX_SERVICE_PID=$!
+    trap 'kill $INDEX_SERVICE_PID' EXIT
+
+    # Wait for the model to load before accepting traffic
+    while [ ! -S "$INDEX_SERVICE_SOCKET" ]; do
+        if ! kill -0 $INDEX_SERVICE_PID 2>/dev/null; then
+            echo "Index service failed to start"
+            exit 1
+        fi
+        sleep 1
+    done
+
+    uvicorn backend.main:app --host 0.0.0.0 --port $PORT --workers $WEB_CONCURRENCY
+else
+    uvicorn backend.main:app --host 0.0.0.0 --port $PORT
+fi